@@ -0,0 +1,153 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+from magwiz.data_sync import DATA_FOLDER, update_data
+from magwiz.db import DB_PATH, get_connection
+from magwiz.export import EXPORT_FORMATS, generate_export
+from magwiz.forecasting import SERVICE_LEVELS
+from magwiz.reports import REPORTS, build_report
+
+# Exit codes of the command line
+EXIT_OK = 0
+EXIT_FAILURE = 1
+EXIT_INTERRUPTED = 130
+
+# Seconds between two progress lines when the output is not a terminal, such as the log of a scheduled job
+PROGRESS_INTERVAL = 10
+
+
+# Function to create a callback printing the messages of an import with the time elapsed since its start
+def create_report_callback(start_time):
+    def report(message):
+        print(f"[{time.perf_counter() - start_time:8.1f}s] {message}", flush=True)
+
+    return report
+
+
+# Function to create a callback printing the import progress of the current table
+# On a terminal the progress line is rewritten in place, otherwise a line is printed at most every few seconds
+def create_progress_callback(stream=sys.stderr):
+    interactive = stream.isatty()
+    last_printed = {'time': 0.0}
+
+    def show_progress(table_name, rows_done, total_rows, rows_per_second):
+        total_text = f"/{total_rows:,}" if total_rows else ''
+        line = f"Reading '{table_name}': {rows_done:,}{total_text} rows ({rows_per_second:,.0f} rows/s)"
+        if interactive:
+            stream.write(f"\r{line}\033[K")
+            if total_rows and rows_done >= total_rows:
+                stream.write('\n')
+            stream.flush()
+        elif time.perf_counter() - last_printed['time'] >= PROGRESS_INTERVAL or (total_rows and rows_done >= total_rows):
+            last_printed['time'] = time.perf_counter()
+            print(line, file=stream, flush=True)
+
+    return show_progress
+
+
+# Function to run the same sync as the "Update data" button of the data exploration page
+def run_import(args):
+    start_time = time.perf_counter()
+    progress = None if args.quiet else create_progress_callback()
+    with get_connection(read_only=False, db_path=args.db) as conn:
+        update_data(conn, folder_path=args.data_folder, report=create_report_callback(start_time),
+                    progress=progress, max_workers=args.workers)
+    print(f"Update completed in {time.perf_counter() - start_time:.1f}s.")
+    return EXIT_OK
+
+
+# Function to find the format of a report file from its extension, Excel when the extension is unknown
+def get_output_format(output_path):
+    extension = os.path.splitext(output_path)[1].lstrip('.').lower()
+    for export_format, settings in EXPORT_FORMATS.items():
+        if settings['extension'] == extension:
+            return export_format
+    return 'Excel'
+
+
+# Function to generate the report of a page and write it to a file
+def run_report(args):
+    export_format = args.format or (get_output_format(args.output) if args.output else 'Excel')
+    output_path = args.output or f"{REPORTS[args.report]['file_stem']}.{EXPORT_FORMATS[export_format]['extension']}"
+    settings = {
+        'dates': args.date,
+        'warehouses': args.warehouse,
+        'product_name': args.product,
+        'start_date': args.start_date,
+        'end_date': args.end_date,
+        'weighting': args.weighting,
+        'window_days': args.window_days,
+        'horizon_days': args.horizon_days,
+        'service_level': args.service_level
+    }
+
+    start_time = time.perf_counter()
+    with get_connection(db_path=args.db) as conn:
+        report_df = build_report(conn, args.report, settings)
+    data = generate_export(report_df, export_format)
+    # The file is replaced at once, so a scheduled job never leaves a partially written report behind
+    temporary_path = f"{output_path}.tmp"
+    with open(temporary_path, 'wb') as output_file:
+        output_file.write(data)
+    os.replace(temporary_path, output_path)
+    print(f"Wrote {len(report_df):,} rows to '{output_path}' in {time.perf_counter() - start_time:.1f}s.")
+    return EXIT_OK
+
+
+# Function to list the reports which can be generated
+def run_list_reports(args):
+    for report_name, settings in REPORTS.items():
+        print(f"{report_name:<22} {settings['page']}")
+    return EXIT_OK
+
+
+# Function to build the parser of the command line arguments
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m magwiz', description="Import warehouse data and generate reports without the app.")
+    parser.add_argument('--db', default=DB_PATH, help=f"path to the SQLite database (default: {DB_PATH})")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    import_parser = commands.add_parser('import', help="update the database from the Excel files")
+    import_parser.add_argument('--data-folder', default=DATA_FOLDER, help=f"folder with the Excel files (default: {DATA_FOLDER})")
+    import_parser.add_argument('--workers', type=int, help="number of processes parsing the Excel files (default: one per changed file)")
+    import_parser.add_argument('--quiet', action='store_true', help="do not print the reading progress")
+    import_parser.set_defaults(run=run_import)
+
+    report_parser = commands.add_parser('report', help="write the report of a page to a file")
+    report_parser.add_argument('report', choices=list(REPORTS), help="name of the report")
+    report_parser.add_argument('-o', '--output', help="output file (default: the report name with the extension of the format)")
+    report_parser.add_argument('--format', choices=list(EXPORT_FORMATS), help="file format (default: from the output extension, else Excel)")
+    report_parser.add_argument('--date', action='append', help="stock date, can be repeated (default: the latest snapshot)")
+    report_parser.add_argument('--warehouse', action='append', help="warehouse name, can be repeated (default: all warehouses)")
+    report_parser.add_argument('--product', help="product name filter")
+    report_parser.add_argument('--start-date', type=datetime.date.fromisoformat, help="first order date, YYYY-MM-DD (default: the first order)")
+    report_parser.add_argument('--end-date', type=datetime.date.fromisoformat, help="last order date, YYYY-MM-DD (default: the last order)")
+    report_parser.add_argument('--weighting', choices=['quantity', 'volume'], help="measure of the ABC analysis (default: quantity)")
+    report_parser.add_argument('--window-days', type=int, help="days of sales used for the demand rate of the forecast")
+    report_parser.add_argument('--horizon-days', type=int, help="forecast horizon in days")
+    report_parser.add_argument('--service-level', choices=list(SERVICE_LEVELS), help="service level of the forecast")
+    report_parser.set_defaults(run=run_report)
+
+    list_parser = commands.add_parser('reports', help="list the available reports")
+    list_parser.set_defaults(run=run_list_reports)
+    return parser
+
+
+# Function to run the command line and return its exit code
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.run(args)
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return EXIT_INTERRUPTED
+    except Exception as error:
+        print(f"Error: {error}", file=sys.stderr)
+        return EXIT_FAILURE
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from magwiz.query_cache import get_data_version, read_query
+from magwiz.sales_index import get_channel_sales, get_sales_totals, to_day_number
+
+# Upper bounds of the cumulative sales share (in %) of categories A and B; the remaining products fall into C
+DEFAULT_THRESHOLDS = (20, 50)
+
+# Names of the categories, from the best selling products to the rest
+CATEGORIES = ['A', 'B', 'C']
+
+# Upper bounds of the coefficient of variation of weekly demand of categories X and Y; less regular products fall into Z
+DEFAULT_XYZ_THRESHOLDS = (0.5, 1.0)
+
+# Names of the demand variability categories, from the most regular demand to the least regular one
+XYZ_CATEGORIES = ['X', 'Y', 'Z']
+
+# Measures the products can be ranked by in the ABC classification
+WEIGHTINGS = {
+    'quantity': 'Sales quantity',
+    'volume': 'Sales volume (quantity x unit volume)'
+}
+
+# Number of classifications kept in memory, keyed by date range and settings
+MAX_CACHED_CLASSIFICATIONS = 32
+
+# Cached classifications in least recently used order
+_classification_cache = OrderedDict()
+_classification_lock = threading.Lock()
+
+
+# Function to fetch the dates of the first and the last order
+def get_order_date_range(conn):
+    query = "SELECT DATE(MIN(order_date)) AS first_date, DATE(MAX(order_date)) AS last_date FROM Orders"
+    row = read_query(query, conn).iloc[0]
+    if row['first_date'] is None:
+        return None, None
+    return datetime.date.fromisoformat(row['first_date']), datetime.date.fromisoformat(row['last_date'])
+
+
+# Function to assign ABC categories to products from their total sales
+# Products are ranked by sales, and each gets the category of its cumulative share of all sales:
+# A up to the first threshold, B up to the second one and C above it
+def classify_abc(product_sales, thresholds=DEFAULT_THRESHOLDS, value_column='Total Sales'):
+    totals = product_sales[value_column].to_numpy(dtype=float)
+    # Best selling products first, ties keep the order of the product codes
+    order = np.argsort(-totals, kind='stable')
+    totals = totals[order]
+
+    total_sales = totals.sum()
+    percentages = totals / total_sales * 100 if total_sales else np.zeros_like(totals)
+    cumulative_percentages = np.cumsum(percentages)
+    category_indexes = np.searchsorted(np.asarray(thresholds, dtype=float), cumulative_percentages, side='left')
+
+    abc_df = product_sales.iloc[order].reset_index(drop=True)
+    abc_df['Sales Percentage'] = percentages
+    abc_df['Cumulative Percentage'] = cumulative_percentages
+    abc_df['ABC Category'] = pd.Categorical.from_codes(np.minimum(category_indexes, len(CATEGORIES) - 1), CATEGORIES)
+    return abc_df
+
+
+# Function to compute the coefficient of variation of the weekly demand of each product
+# Weeks without sales count as zero demand, so the statistics only need the sums and sums of squares of the sales
+def compute_demand_variation(product_indexes, weekly_quantities, num_products, num_weeks):
+    sums = np.bincount(product_indexes, weights=weekly_quantities, minlength=num_products)
+    sums_of_squares = np.bincount(product_indexes, weights=weekly_quantities ** 2, minlength=num_products)
+    means = sums / num_weeks
+    variances = np.maximum(sums_of_squares / num_weeks - means ** 2, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variations = np.where(means > 0, np.sqrt(variances) / means, np.inf)
+    return means, variations
+
+
+# Function to classify the products ordered between two dates by sales (ABC), demand variability (XYZ)
+# and sales channel. Returns one row per product and the list of sales channels
+def classify_products(conn, start_date, end_date, weighting='quantity', thresholds=DEFAULT_THRESHOLDS,
+                      xyz_thresholds=DEFAULT_XYZ_THRESHOLDS):
+    key = (get_data_version(conn), start_date, end_date, weighting, tuple(thresholds), tuple(xyz_thresholds))
+    with _classification_lock:
+        if key in _classification_cache:
+            _classification_cache.move_to_end(key)
+            products_df, channels = _classification_cache[key]
+            return products_df.copy(), channels
+
+    # Totals come from the running totals of the sales index, so the cost depends on the number of products
+    # rather than on the number of order lines in the period
+    totals = get_sales_totals(conn, start_date, end_date)
+    totals = totals[totals['total_sales'] > 0]
+    products = read_query("SELECT product_code, product_name, unit_volume FROM Products", conn)
+    products_df = totals.merge(products, on='product_code')
+    product_codes = products_df['product_code'].to_numpy()
+    num_products = len(product_codes)
+    unit_volumes = products_df['unit_volume'].fillna(0).to_numpy(dtype=float)
+    total_sales = products_df['total_sales'].to_numpy()
+
+    # Daily sales per channel come from the channel sales index, which the sync keeps up to date
+    sales = get_channel_sales(conn, start_date, end_date)
+    sales = sales[(sales['quantity'] > 0) & sales['product_code'].isin(product_codes)]
+    product_indexes = np.searchsorted(product_codes, sales['product_code'].to_numpy())
+    channel_indexes, channels = pd.factorize(sales['sales_channel'], sort=True)
+    quantities = sales['quantity'].to_numpy(dtype=float)
+    values = quantities * unit_volumes[product_indexes] if weighting == 'volume' else quantities
+
+    # Per product totals of all channels and per channel
+    products_df = pd.DataFrame({
+        'Product Code': product_codes,
+        'Product Name': products_df['product_name'],
+        'Total Sales': total_sales.astype('int64'),
+        'Sales Value': total_sales * unit_volumes if weighting == 'volume' else total_sales.astype(float)
+    })
+    channel_values = np.zeros((num_products, len(channels)))
+    np.add.at(channel_values, (product_indexes, channel_indexes), values)
+    for index, channel in enumerate(channels):
+        products_df[f"Sales via {channel}"] = channel_values[:, index]
+
+    # Weekly demand of each product, summed over the channels, in weeks counted from the start date
+    num_weeks = (end_date - start_date).days // 7 + 1
+    weeks = (sales['day'].to_numpy() - to_day_number(start_date)) // 7
+    weekly = pd.DataFrame({'product': product_indexes, 'week': weeks, 'quantity': quantities})
+    weekly = weekly.groupby(['product', 'week'], sort=False)['quantity'].sum().reset_index()
+    means, variations = compute_demand_variation(
+        weekly['product'].to_numpy(), weekly['quantity'].to_numpy(), num_products, num_weeks
+    )
+    products_df['Mean Weekly Demand'] = means
+    products_df['Demand Variation'] = variations
+    xyz_indexes = np.searchsorted(np.asarray(xyz_thresholds, dtype=float), variations, side='left')
+    products_df['XYZ Category'] = pd.Categorical.from_codes(np.minimum(xyz_indexes, len(XYZ_CATEGORIES) - 1), XYZ_CATEGORIES)
+
+    products_df = classify_abc(products_df, thresholds, value_column='Sales Value')
+    channels = list(channels)
+
+    with _classification_lock:
+        _classification_cache[key] = (products_df, channels)
+        while len(_classification_cache) > MAX_CACHED_CLASSIFICATIONS:
+            _classification_cache.popitem(last=False)
+    return products_df.copy(), channels
+
+
+# Function to prepare the classified products for display and download, with their combined class and
+# sales shares formatted as percentages
+def format_abc_report(products_df):
+    report = products_df.drop(columns=['Product Code'])
+    report['ABC/XYZ Class'] = report['ABC Category'].astype(str) + report['XYZ Category'].astype(str)
+    report['Sales Percentage'] = report['Sales Percentage'].round(2).astype(str) + '%'
+    report['Cumulative Percentage'] = report['Cumulative Percentage'].round(2).astype(str) + '%'
+    return report
+
+
+# Function to count the products and sum their sales value in each cell of the ABC/XYZ matrix
+def build_abc_xyz_matrix(products_df):
+    index = pd.Index(CATEGORIES, name='ABC Category')
+    columns = pd.Index(XYZ_CATEGORIES, name='XYZ Category')
+    counts = pd.crosstab(products_df['ABC Category'], products_df['XYZ Category'])
+    values = pd.crosstab(products_df['ABC Category'], products_df['XYZ Category'], values=products_df['Sales Value'], aggfunc='sum')
+    counts = counts.reindex(index=index, columns=columns, fill_value=0)
+    values = values.reindex(index=index, columns=columns).fillna(0)
+    return counts, values
+
+
+# Function to sum the sales value of each ABC category per sales channel
+def build_channel_breakdown(products_df, channels):
+    columns = [f"Sales via {channel}" for channel in channels]
+    breakdown = products_df.groupby('ABC Category', observed=False)[columns].sum()
+    breakdown.columns = channels
+    return breakdown
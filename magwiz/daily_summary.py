@@ -0,0 +1,63 @@
+# Column of WarehouseStock holding the key of each table whose changes affect the daily summary
+SUMMARY_KEY_COLUMNS = {
+    'WarehouseStock': 'stock_id',
+    'Products': 'product_code',
+    'Warehouses': 'warehouse_id'
+}
+
+# Query aggregating the stock snapshots per day and warehouse
+# Snapshots without a warehouse have no row in the summary, which is keyed by warehouse
+SUMMARY_QUERY = """
+    SELECT
+        ws.stock_day,
+        ws.warehouse_id,
+        SUM(ws.quantity_available),
+        SUM(p.unit_volume * ws.quantity_available),
+        ROUND((SUM(p.unit_volume * ws.quantity_available) / w.capacity) * 100, 2),
+        COUNT(DISTINCT ws.product_code)
+    FROM main.WarehouseStock ws
+    LEFT JOIN main.Products p ON ws.product_code = p.product_code
+    LEFT JOIN main.Warehouses w ON ws.warehouse_id = w.warehouse_id
+    WHERE ws.warehouse_id IS NOT NULL AND {where_clause}
+    GROUP BY ws.stock_day, ws.warehouse_id
+"""
+
+
+# Function to rebuild the whole daily summary from the stock snapshots
+def refresh_daily_summary(conn):
+    conn.execute("DELETE FROM main.DailyWarehouseSummary")
+    conn.execute(f"""
+        INSERT INTO main.DailyWarehouseSummary
+        {SUMMARY_QUERY.format(where_clause='ws.stock_day IS NOT NULL')}
+    """)
+
+
+# Function to rebuild the daily summary of the days listed in the temp.summary_days table
+def refresh_summary_days(conn):
+    conn.execute("DELETE FROM main.DailyWarehouseSummary WHERE day IN (SELECT day FROM temp.summary_days)")
+    conn.execute(f"""
+        INSERT INTO main.DailyWarehouseSummary
+        {SUMMARY_QUERY.format(where_clause='ws.stock_day IN (SELECT day FROM temp.summary_days)')}
+    """)
+
+
+# Function to remember the days holding stock rows affected by a table sync
+# Runs before the changes are applied to find the old days, and again afterwards to find the new ones
+def collect_summary_days(conn, table_name):
+    column = SUMMARY_KEY_COLUMNS[table_name]
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS summary_days (day TEXT PRIMARY KEY)")
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.summary_days (day)
+        SELECT DISTINCT stock_day FROM main.WarehouseStock
+        WHERE stock_day IS NOT NULL
+          AND {column} IN (SELECT row_key FROM temp.sync_deleted UNION ALL SELECT row_key FROM temp.sync_changed)
+    """)
+
+
+# Function to bring the daily summary of the days affected by a table sync up to date
+def update_summary_days(conn, table_name):
+    collect_summary_days(conn, table_name)
+    try:
+        refresh_summary_days(conn)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.summary_days")
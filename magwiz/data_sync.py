@@ -0,0 +1,480 @@
+import hashlib
+import math
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import datetime
+from concurrent.futures import ProcessPoolExecutor, wait
+from graphlib import TopologicalSorter
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from magwiz.daily_summary import collect_summary_days, update_summary_days
+from magwiz.delay_histogram import collect_delay_parties, update_delay_parties
+from magwiz.excel_cache import count_workbook_rows, iter_workbook_chunks
+from magwiz.migrations import run_migrations
+from magwiz.query_cache import bump_data_version, ensure_data_version_table
+from magwiz.sales_index import collect_sales_products, update_sales_products
+from magwiz.shortage_alerts import collect_shortage_pairs, count_shortage_events, update_shortage_pairs
+
+# Folder containing the source Excel files
+DATA_FOLDER = 'data'
+
+# Excel files and their corresponding SQL tables
+EXCEL_FILES = {
+    'suppliers.xlsx': 'Suppliers',
+    'products.xlsx': 'Products',
+    'warehouses.xlsx': 'Warehouses',
+    'warehouse_stock.xlsx': 'WarehouseStock',
+    'customers.xlsx': 'Customers',
+    'orders.xlsx': 'Orders',
+    'order_details.xlsx': 'OrderDetails',
+    'deliveries.xlsx': 'Deliveries',
+    'delivery_details.xlsx': 'DeliveryDetails'
+}
+
+# Tables referenced by each table through foreign keys, which must be imported first
+TABLE_DEPENDENCIES = {
+    'Suppliers': [],
+    'Products': [],
+    'Warehouses': [],
+    'Customers': [],
+    'WarehouseStock': ['Products', 'Warehouses'],
+    'Orders': ['Customers'],
+    'Deliveries': ['Suppliers'],
+    'OrderDetails': ['Orders', 'Products'],
+    'DeliveryDetails': ['Deliveries', 'Products']
+}
+
+# Functions keeping derived tables up to date, called within the transaction of a table sync
+# Each pair is called with the connection and table name: the first function before the changes are applied
+# and the second one afterwards. Both can read the affected keys from temp.sync_deleted and temp.sync_changed
+SYNC_HOOKS = {
+    'WarehouseStock': [(collect_summary_days, update_summary_days), (collect_shortage_pairs, update_shortage_pairs)],
+    'Products': [(collect_summary_days, update_summary_days), (collect_shortage_pairs, update_shortage_pairs)],
+    'Warehouses': [(collect_summary_days, update_summary_days)],
+    'Orders': [(collect_sales_products, update_sales_products), (collect_delay_parties, update_delay_parties)],
+    'OrderDetails': [(collect_sales_products, update_sales_products)],
+    'Deliveries': [(collect_delay_parties, update_delay_parties)]
+}
+
+# Size of the blocks read while hashing an Excel file
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+# Raised when an import is cancelled, after which none of its changes are kept
+class ImportCancelled(Exception):
+    pass
+
+
+# Function to create the tables storing file hashes and row fingerprints of the last sync
+def ensure_sync_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS SyncFiles (
+            table_name TEXT PRIMARY KEY,
+            file_name TEXT NOT NULL,
+            file_hash TEXT NOT NULL,
+            synced_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS SyncRowHashes (
+            table_name TEXT NOT NULL,
+            row_key INTEGER NOT NULL,
+            row_hash TEXT NOT NULL,
+            PRIMARY KEY (table_name, row_key)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
+    ensure_data_version_table(conn)
+
+
+# Function to compute the content hash of a file
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Function to fetch the hash of the file used in the last sync of a table
+def get_stored_file_hash(conn, table_name):
+    row = conn.execute("SELECT file_hash FROM SyncFiles WHERE table_name = ?", (table_name,)).fetchone()
+    return row[0] if row else None
+
+
+# Function to fetch the column names of a table (the first column is the primary key)
+def get_table_columns(conn, table_name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+# Function to fetch the column names of a table along with their declared types
+def get_table_schema(conn, table_name):
+    return [(row[1], row[2]) for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+# Function to convert a value read from Excel into a value stored by SQLite
+def to_sql_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    if isinstance(value, float) and value.is_integer():
+        # Whole numbers are stored the same way whether they were read as integers or floats
+        return int(value)
+    if isinstance(value, datetime.datetime):
+        # Same text format pandas used when the tables were first filled
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # Convert numpy scalars to plain Python values
+        return value.item()
+    return value
+
+
+# Function to convert a column of values read from Excel into values stored by SQLite, the same way as to_sql_value
+# Arrow columns of the cached copies are converted as a whole, and other columns value by value
+def to_sql_column(column):
+    if not isinstance(column, pa.Array):
+        return [to_sql_value(value) for value in column]
+    column_type = column.type
+    try:
+        if pa.types.is_integer(column_type) or pa.types.is_string(column_type) or pa.types.is_boolean(column_type):
+            return column.to_pylist()
+        if pa.types.is_floating(column_type):
+            values = column.to_numpy(zero_copy_only=False)
+            missing = np.isnan(values)
+            # Columns of whole numbers are stored as integers, other columns mix integers and floats
+            if np.all(missing | (np.isfinite(values) & (values == np.floor(values)))):
+                return pa.array(values, mask=missing).cast(pa.int64()).to_pylist()
+        elif pa.types.is_timestamp(column_type) and column_type.tz is None:
+            # The cast fails for fractions of seconds, which isoformat writes out
+            return pc.strftime(column.cast(pa.timestamp('s')), format='%Y-%m-%d %H:%M:%S').to_pylist()
+        elif pa.types.is_date(column_type):
+            return pc.strftime(column, format='%Y-%m-%d').to_pylist()
+    except pa.ArrowInvalid:
+        pass
+    return [to_sql_value(value) for value in column.to_pylist()]
+
+
+# Function to compute the fingerprint of a row
+def hash_row(row):
+    return hashlib.blake2b(repr(row).encode(), digest_size=8).hexdigest()
+
+
+# Function to remove duplicates from the first column of a table
+def remove_duplicates(conn, table_name):
+    key = get_table_columns(conn, table_name)[0]
+    cursor = conn.execute(f"""
+        DELETE FROM {table_name}
+        WHERE rowid NOT IN (SELECT MIN(rowid) FROM {table_name} GROUP BY {key})
+    """)
+    return cursor.rowcount
+
+
+# Function to parse an Excel file into a staging database file
+# Runs in a worker process, so it only touches its own staging file and never the main database.
+# Parsing stops at the next chunk of rows once the optional cancel event is set
+def parse_workbook(table_name, excel_path, file_hash, schema, staging_path, progress=None, cancel_event=None):
+    columns = [column for column, column_type in schema]
+    key = columns[0]
+    placeholders = ', '.join(['?'] * (len(columns) + 1))
+
+    staging_conn = sqlite3.connect(staging_path)
+    try:
+        # The staging file is thrown away after the sync, so it does not need to be crash-safe
+        staging_conn.execute("PRAGMA journal_mode = OFF")
+        staging_conn.execute("PRAGMA synchronous = OFF")
+        # Declared types match the target table, so that joins on the key can use the index
+        column_definitions = ', '.join(f"{column} {column_type}" for column, column_type in schema)
+        staging_conn.execute(f"CREATE TABLE rows ({column_definitions}, row_hash TEXT)")
+        # The unique key keeps the first occurrence of duplicated keys in the Excel file
+        staging_conn.execute(f"CREATE UNIQUE INDEX rows_key ON rows ({key})")
+
+        total_rows = count_workbook_rows(excel_path, file_hash)
+        num_rows_read = 0
+        start_time = time.perf_counter()
+        # Workbooks parsed before are read from their columnar cache instead of the Excel XML
+        for positions, values in iter_workbook_chunks(excel_path, file_hash, columns):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ImportCancelled()
+            rows = []
+            for position, row in zip(to_sql_column(positions), zip(*(to_sql_column(column) for column in values))):
+                # Rows without a key get their position in the file, which is the key SQLite assigned on the first load
+                if row[0] is None:
+                    row = (position,) + row[1:]
+                rows.append(row + (hash_row(row),))
+            staging_conn.executemany(f"INSERT OR IGNORE INTO rows VALUES ({placeholders})", rows)
+
+            num_rows_read += len(rows)
+            if progress:
+                elapsed = time.perf_counter() - start_time
+                progress((table_name, num_rows_read, total_rows, num_rows_read / elapsed if elapsed else 0.0))
+
+        staging_conn.commit()
+        num_staged = staging_conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+    finally:
+        staging_conn.close()
+
+    return num_rows_read, num_staged
+
+
+# Function to apply the rows of a staging database file, attached under the given schema name, to its table
+# The changes are made within a savepoint, so they are applied completely or not at all, and they become
+# part of the caller's transaction when there is one
+def apply_staged_rows(conn, table_name, staged_schema, excel_file, file_hash):
+    columns = get_table_columns(conn, table_name)
+    key = columns[0]
+    column_list = ', '.join(columns)
+
+    conn.execute("SAVEPOINT apply_staged_rows")
+    try:
+        try:
+            num_duplicates_removed = remove_duplicates(conn, table_name)
+
+            # Keys which no longer exist in the Excel file
+            conn.execute(f"""
+                CREATE TEMP TABLE sync_deleted AS
+                SELECT t.{key} AS row_key
+                FROM main.{table_name} t
+                LEFT JOIN {staged_schema}.rows s ON s.{key} = t.{key}
+                WHERE s.{key} IS NULL
+            """)
+            # Keys which are new or whose fingerprint differs from the last sync
+            conn.execute(f"""
+                CREATE TEMP TABLE sync_changed AS
+                SELECT s.{key} AS row_key, t.{key} IS NULL AS is_new
+                FROM {staged_schema}.rows s
+                LEFT JOIN main.SyncRowHashes h ON h.table_name = '{table_name}' AND h.row_key = s.{key}
+                LEFT JOIN main.{table_name} t ON t.{key} = s.{key}
+                WHERE h.row_hash IS NOT s.row_hash
+            """)
+
+            for before_apply, after_apply in SYNC_HOOKS.get(table_name, []):
+                before_apply(conn, table_name)
+
+            num_deleted_records = conn.execute(f"""
+                DELETE FROM main.{table_name}
+                WHERE {key} IN (SELECT row_key FROM temp.sync_deleted)
+            """).rowcount
+
+            assignments = ', '.join(f"{column} = s.{column}" for column in columns[1:])
+            num_updated_records = 0
+            if assignments:
+                num_updated_records = conn.execute(f"""
+                    UPDATE main.{table_name}
+                    SET {assignments}
+                    FROM {staged_schema}.rows s
+                    WHERE {table_name}.{key} = s.{key}
+                      AND s.{key} IN (SELECT row_key FROM temp.sync_changed WHERE NOT is_new)
+                """).rowcount
+
+            num_added_records = conn.execute(f"""
+                INSERT INTO main.{table_name} ({column_list})
+                SELECT {column_list} FROM {staged_schema}.rows
+                WHERE {key} IN (SELECT row_key FROM temp.sync_changed WHERE is_new)
+            """).rowcount
+
+            for before_apply, after_apply in SYNC_HOOKS.get(table_name, []):
+                after_apply(conn, table_name)
+
+            # Cached query results become stale only when the data actually changed
+            if num_duplicates_removed or num_deleted_records or num_updated_records or num_added_records:
+                bump_data_version(conn)
+
+            # Store the fingerprints and the file hash of this sync
+            conn.execute("""
+                DELETE FROM main.SyncRowHashes
+                WHERE table_name = ? AND row_key IN (SELECT row_key FROM temp.sync_deleted)
+            """, (table_name,))
+            conn.execute(f"""
+                INSERT OR REPLACE INTO main.SyncRowHashes (table_name, row_key, row_hash)
+                SELECT ?, {key}, row_hash FROM {staged_schema}.rows
+                WHERE {key} IN (SELECT row_key FROM temp.sync_changed)
+            """, (table_name,))
+            conn.execute("""
+                INSERT OR REPLACE INTO main.SyncFiles (table_name, file_name, file_hash, synced_at)
+                VALUES (?, ?, ?, ?)
+            """, (table_name, excel_file, file_hash, datetime.datetime.now().isoformat(' ', 'seconds')))
+        except BaseException:
+            # Some errors already roll back the whole transaction, and with it the savepoint
+            if conn.in_transaction:
+                conn.execute("ROLLBACK TO apply_staged_rows")
+                conn.execute("RELEASE apply_staged_rows")
+            raise
+        conn.execute("RELEASE apply_staged_rows")
+    finally:
+        for temp_table in ('sync_deleted', 'sync_changed'):
+            conn.execute(f"DROP TABLE IF EXISTS temp.{temp_table}")
+
+    return {
+        'duplicates_removed': num_duplicates_removed,
+        'added': num_added_records,
+        'updated': num_updated_records,
+        'deleted': num_deleted_records
+    }
+
+
+# Function to refresh the statistics the query planner uses to choose indexes
+def refresh_statistics(conn):
+    conn.execute("ANALYZE")
+    conn.commit()
+
+
+# Function to sort tables so that every table comes after the tables it references
+def get_import_order(table_names):
+    sorter = TopologicalSorter({
+        table_name: [dependency for dependency in TABLE_DEPENDENCIES[table_name] if dependency in table_names]
+        for table_name in table_names
+    })
+    return list(sorter.static_order())
+
+
+# Function to display the result of syncing one table
+def report_sync_result(report, excel_file, table_name, result):
+    if result['duplicates_skipped'] > 0:
+        report(f"Skipped {result['duplicates_skipped']} duplicates in the '{excel_file}' file.")
+    if result['duplicates_removed'] > 0:
+        report(f"Removed {result['duplicates_removed']} duplicates from the '{table_name}' table.")
+    report(f"Added {result['added']} new records to the '{table_name}' table.")
+    if result['updated'] > 0:
+        report(f"Updated {result['updated']} records in the '{table_name}' table.")
+    if result['deleted'] > 0:
+        report(f"Deleted {result['deleted']} records from the '{table_name}' table.")
+
+
+# Function to display the shortage alerts opened and resolved by an import
+def report_shortage_alerts(report, conn, events_before):
+    num_events, num_resolved = count_shortage_events(conn)
+    num_opened = num_events - events_before[0]
+    num_newly_resolved = num_resolved - events_before[1]
+    if num_opened > 0:
+        report(f"Opened {num_opened} new shortage alerts.")
+    if num_newly_resolved > 0:
+        report(f"Resolved {num_newly_resolved} shortage alerts.")
+
+
+# Function to raise the cancellation of an import once its cancel event is set
+def check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise ImportCancelled()
+
+
+# Function to parse the changed workbooks into staging database files
+# Workbooks are parsed in parallel worker processes, and the progress of all of them is forwarded from this process
+def parse_workbooks(import_order, changed_files, schemas, staging_paths, progress=None, max_workers=None, cancel_event=None):
+    if max_workers is None:
+        max_workers = min(len(import_order), os.cpu_count() or 1)
+
+    parsed = {}
+    if max_workers <= 1:
+        # Workbooks are parsed one by one in this process to avoid starting a worker pool
+        forward_progress = (lambda update: progress(*update)) if progress else None
+        for table_name in import_order:
+            excel_file, excel_path, file_hash = changed_files[table_name]
+            parsed[table_name] = parse_workbook(table_name, excel_path, file_hash, schemas[table_name],
+                                                staging_paths[table_name], forward_progress, cancel_event)
+        return parsed
+
+    # The spawn start method avoids forking the threads of the Streamlit server
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager, ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        progress_queue = manager.Queue() if progress else None
+        # Threading events cannot be shared with worker processes, so a cancellation is passed on to this event
+        worker_cancel_event = manager.Event() if cancel_event is not None else None
+        futures = {}
+        for table_name in import_order:
+            excel_file, excel_path, file_hash = changed_files[table_name]
+            futures[table_name] = pool.submit(
+                parse_workbook, table_name, excel_path, file_hash, schemas[table_name], staging_paths[table_name],
+                progress_queue.put if progress_queue else None, worker_cancel_event
+            )
+
+        pending = set(futures.values())
+        while pending:
+            pending = wait(pending, timeout=0.2).not_done
+            if cancel_event is not None and cancel_event.is_set():
+                worker_cancel_event.set()
+            # Progress updates are displayed from this process, which owns the page
+            while progress_queue and not progress_queue.empty():
+                progress(*progress_queue.get())
+
+        for table_name in import_order:
+            parsed[table_name] = futures[table_name].result()
+    return parsed
+
+
+# Function to update data from Excel files
+# Workbooks are parsed in parallel worker processes into staging files first. This process is the only writer
+# of the database and then applies the tables in foreign key order within a single transaction, so readers keep
+# seeing the data of the previous import until all tables are updated, and a failed or cancelled import changes
+# nothing. The optional progress callback receives the table name, rows read so far, the expected number of rows
+# (None when unknown) and the reading speed in rows per second, and the optional result callback receives the
+# table name and the numbers of changed records. The import stops once the optional cancel event is set,
+# at the next chunk of rows while reading and after the current table while applying
+def update_data(conn, folder_path=DATA_FOLDER, report=print, progress=None, max_workers=None, on_result=None,
+                cancel_event=None):
+    # The tables, constraints and indexes are brought up to date before any rows are written
+    run_migrations(conn)
+    ensure_sync_tables(conn)
+
+    # Find the workbooks which changed since the last sync
+    changed_files = {}
+    for excel_file, table_name in EXCEL_FILES.items():
+        excel_path = os.path.join(folder_path, excel_file)
+        if not os.path.exists(excel_path):
+            report(f"The file '{excel_file}' does not exist. Skipping...")
+            continue
+
+        # Skip workbooks whose content has not changed since the last sync
+        file_hash = hash_file(excel_path)
+        if file_hash == get_stored_file_hash(conn, table_name):
+            report(f"The file '{excel_file}' has not changed since the last update. Skipping...")
+            continue
+
+        changed_files[table_name] = (excel_file, excel_path, file_hash)
+
+    if not changed_files:
+        return
+
+    import_order = get_import_order(changed_files)
+    schemas = {table_name: get_table_schema(conn, table_name) for table_name in import_order}
+
+    with tempfile.TemporaryDirectory(prefix='magwiz-sync-') as staging_folder:
+        staging_paths = {table_name: os.path.join(staging_folder, f"{table_name}.db") for table_name in import_order}
+        parsed = parse_workbooks(import_order, changed_files, schemas, staging_paths, progress, max_workers, cancel_event)
+        check_cancelled(cancel_event)
+
+        # Databases cannot be attached within a transaction, so all staging files are attached beforehand
+        staged_schemas = {table_name: f"staged_{index}" for index, table_name in enumerate(import_order)}
+        for table_name in import_order:
+            conn.execute("ATTACH DATABASE ? AS " + staged_schemas[table_name], (staging_paths[table_name],))
+        try:
+            # The write lock is taken at once, so the import waits for other writers instead of failing halfway
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                events_before = count_shortage_events(conn)
+                for table_name in import_order:
+                    check_cancelled(cancel_event)
+                    excel_file, excel_path, file_hash = changed_files[table_name]
+                    num_rows_read, num_staged = parsed[table_name]
+                    result = apply_staged_rows(conn, table_name, staged_schemas[table_name], excel_file, file_hash)
+                    result['duplicates_skipped'] = num_rows_read - num_staged
+                    report_sync_result(report, excel_file, table_name, result)
+                    if on_result:
+                        on_result(table_name, result)
+                check_cancelled(cancel_event)
+                report_shortage_alerts(report, conn, events_before)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            for staged_schema in staged_schemas.values():
+                conn.execute(f"DETACH DATABASE {staged_schema}")
+
+    refresh_statistics(conn)
@@ -0,0 +1,115 @@
+import os
+import pathlib
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from magwiz.migrations import MIGRATIONS, get_schema_version
+
+# Path to the SQLite database
+DB_PATH = 'db_inventory.db'
+
+# Number of idle read-only connections kept open per database
+POOL_SIZE = 8
+
+# Size of the memory-mapped part of the database file in bytes
+MMAP_SIZE = 256 * 1024 * 1024
+
+# Size of the page cache of each connection in KiB
+CACHE_SIZE_KIB = 64 * 1024
+
+# Number of prepared statements each connection keeps for reuse
+# Queries bind their filters as parameters, so each filter shape is prepared only once per connection
+STATEMENT_CACHE_SIZE = 256
+
+# Seconds a connection waits for a lock before failing with "database is locked"
+BUSY_TIMEOUT = 30
+
+# Pools of idle connections, keyed by database path and access mode
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Locks making sure that only one connection writes to a database at a time
+_write_locks = {}
+
+
+# Function to apply the settings shared by all connections
+def configure_connection(conn, read_only):
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    if not read_only:
+        # WAL lets readers keep reading the last committed data while an import is writing
+        conn.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode NORMAL only syncs at checkpoints and stays safe against corruption
+        conn.execute("PRAGMA synchronous = NORMAL")
+
+
+# Function to open a configured connection to the database
+def open_connection(db_path=DB_PATH, read_only=True):
+    if read_only:
+        # The read-only URI guarantees that dashboard pages never take a write lock
+        uri = pathlib.Path(db_path).resolve().as_uri() + '?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    else:
+        conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                               cached_statements=STATEMENT_CACHE_SIZE)
+    configure_connection(conn, read_only)
+    return conn
+
+
+# Function to check that a database exists and has the current schema before pages read from it
+# Only imports bring the schema up to date, so reading never needs the write lock that an import may be holding
+def check_database(db_path):
+    if not os.path.exists(db_path):
+        raise FileNotFoundError(f"The database '{db_path}' does not exist. Update the data from the Excel files "
+                                f"on the data exploration page or with 'python -m magwiz import' to create it.")
+    conn = open_connection(db_path, read_only=True)
+    try:
+        schema_version = get_schema_version(conn)
+    finally:
+        conn.close()
+    if schema_version < len(MIGRATIONS):
+        raise RuntimeError(f"The database '{db_path}' has an older schema. Update the data from the Excel files "
+                           f"on the data exploration page or with 'python -m magwiz import' to upgrade it.")
+
+
+# Function to fetch the pool of idle connections for a database and access mode
+def get_pool(db_path, read_only):
+    key = (os.path.abspath(db_path), read_only)
+    with _pools_lock:
+        if key not in _pools:
+            if read_only:
+                check_database(db_path)
+            _pools[key] = queue.Queue(maxsize=POOL_SIZE if read_only else 1)
+            _write_locks[key] = threading.Lock()
+        return _pools[key], _write_locks[key]
+
+
+# Function to borrow a connection from the pool
+# Read-only connections can be used by many sessions in parallel, while write connections are handed out one at a time
+@contextmanager
+def get_connection(read_only=True, db_path=DB_PATH):
+    pool, write_lock = get_pool(db_path, read_only)
+    if not read_only:
+        write_lock.acquire()
+    try:
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = open_connection(db_path, read_only)
+
+        try:
+            yield conn
+        finally:
+            # Connections go back to the pool without an open transaction
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+    finally:
+        if not read_only:
+            write_lock.release()
@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from magwiz.query_cache import read_query
+from magwiz.sales_index import to_day_number
+from magwiz.timeliness import TIMELINESS_KINDS
+
+# Kind of timeliness stored for the records of each table
+TABLE_KINDS = {
+    'Deliveries': 'delivery',
+    'Orders': 'shipping'
+}
+
+# Percentiles of the delays reported per supplier and customer
+DELAY_PERCENTILES = [50, 90, 99]
+
+# Query counting the records of each party per order day and delay in days (negative when completed early)
+# Delays are whole days, so these histograms hold the exact distribution, and the histograms of any range
+# of days add up to the histogram of the whole range
+HISTOGRAM_QUERY = """
+    SELECT
+        '{kind}',
+        CAST(julianday(DATE(t.order_date)) - julianday('1970-01-01') AS INTEGER) AS day,
+        t.{party_id_column},
+        CAST(julianday(DATE(t.{actual_column})) - julianday(DATE(t.{expected_column})) AS INTEGER) AS delay_days,
+        COUNT(*)
+    FROM main.{table} t
+    WHERE t.order_date IS NOT NULL AND t.{expected_column} IS NOT NULL AND t.{actual_column} IS NOT NULL
+      AND t.{party_id_column} IS NOT NULL AND {where_clause}
+    GROUP BY day, t.{party_id_column}, delay_days
+"""
+
+
+# Function to rebuild the histograms of a kind of timeliness, for the parties matching a condition
+def insert_histograms(conn, kind, where_clause):
+    settings = TIMELINESS_KINDS[kind]
+    conn.execute(f"INSERT INTO main.DelayHistogram {HISTOGRAM_QUERY.format(kind=kind, where_clause=where_clause, **settings)}")
+
+
+# Function to rebuild all delay histograms from the deliveries and orders
+def refresh_delay_histogram(conn):
+    conn.execute("DELETE FROM main.DelayHistogram")
+    for kind in TIMELINESS_KINDS:
+        insert_histograms(conn, kind, '1')
+
+
+# Function to rebuild the delay histograms of the parties listed in the temp.delay_parties table
+def refresh_delay_parties(conn, kind):
+    conn.execute("DELETE FROM main.DelayHistogram WHERE kind = ? AND party_id IN (SELECT party_id FROM temp.delay_parties)", (kind,))
+    party_id_column = TIMELINESS_KINDS[kind]['party_id_column']
+    insert_histograms(conn, kind, f"t.{party_id_column} IN (SELECT party_id FROM temp.delay_parties)")
+
+
+# Function to remember the suppliers or customers whose records are affected by a table sync
+# Runs before the changes are applied to find the old parties, and again afterwards to find the new ones
+def collect_delay_parties(conn, table_name):
+    settings = TIMELINESS_KINDS[TABLE_KINDS[table_name]]
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS delay_parties (party_id INTEGER PRIMARY KEY)")
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.delay_parties (party_id)
+        SELECT {settings['party_id_column']} FROM main.{table_name}
+        WHERE {settings['party_id_column']} IS NOT NULL
+          AND {settings['id_column']} IN (SELECT row_key FROM temp.sync_deleted UNION ALL SELECT row_key FROM temp.sync_changed)
+    """)
+
+
+# Function to bring the delay histograms of the parties affected by a table sync up to date
+def update_delay_parties(conn, table_name):
+    collect_delay_parties(conn, table_name)
+    try:
+        refresh_delay_parties(conn, TABLE_KINDS[table_name])
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.delay_parties")
+
+
+# Function to load the histogram of the delays of each party for the records ordered between two dates (both included)
+# The daily histograms of the range are merged by the database, so no delay of the raw records is read or sorted
+def load_delay_histogram(conn, kind, start_date, end_date):
+    settings = TIMELINESS_KINDS[kind]
+    query = f"""
+        SELECT h.party_id, p.{settings['party_name_column']} AS party_name, h.delay_days, SUM(h.count) AS count
+        FROM DelayHistogram h
+        LEFT JOIN {settings['party_table']} p ON h.party_id = p.{settings['party_id_column']}
+        WHERE h.kind = ? AND h.day BETWEEN ? AND ?
+        GROUP BY h.party_id, h.delay_days
+        ORDER BY h.party_id, h.delay_days
+    """
+    return read_query(query, conn, params=[kind, to_day_number(start_date), to_day_number(end_date)])
+
+
+# Function to compute percentiles of delays from histograms sorted by group and delay, for all groups at once
+# Each percentile is the smallest delay whose cumulative count reaches that share of the records of its group
+def compute_histogram_percentiles(group_indexes, delays, counts, percentiles=DELAY_PERCENTILES):
+    num_groups = group_indexes.max() + 1 if len(group_indexes) else 0
+    cumulative_counts = np.cumsum(counts)
+    totals = np.bincount(group_indexes, weights=counts, minlength=num_groups)
+    # Cumulative count of all groups before each group
+    offsets = np.cumsum(totals) - totals
+    results = {}
+    for percentile in percentiles:
+        ranks = np.maximum(np.ceil(totals * percentile / 100), 1)
+        positions = np.searchsorted(cumulative_counts, offsets + ranks, side='left')
+        results[percentile] = delays[positions]
+    return totals.astype('int64'), results
+
+
+# Function to compute the delay percentiles of each supplier or customer from a loaded histogram
+# Returns one row per party, the largest delays first
+def compute_party_percentiles(histogram, kind, percentiles=DELAY_PERCENTILES):
+    party_indexes, party_ids = pd.factorize(histogram['party_id'])
+    totals, results = compute_histogram_percentiles(
+        party_indexes, histogram['delay_days'].to_numpy(), histogram['count'].to_numpy(), percentiles
+    )
+    percentile_columns = [f"p{percentile} Delay (days)" for percentile in percentiles]
+    percentiles_df = pd.DataFrame({
+        TIMELINESS_KINDS[kind]['party_label']: histogram.drop_duplicates('party_id')['party_name'].to_numpy(),
+        'Records': totals,
+        **{column: results[percentile] for column, percentile in zip(percentile_columns, percentiles)}
+    })
+    return percentiles_df.sort_values(percentile_columns[::-1] + ['Records'], ascending=False).reset_index(drop=True)
+
+
+# Function to compute the delay percentiles of all suppliers or customers together from a loaded histogram
+def compute_overall_percentiles(histogram, percentiles=DELAY_PERCENTILES):
+    overall = histogram.groupby('delay_days')['count'].sum()
+    if overall.empty:
+        return {}
+    totals, results = compute_histogram_percentiles(
+        np.zeros(len(overall), dtype=np.int64), overall.index.to_numpy(), overall.to_numpy(), percentiles
+    )
+    return {percentile: int(values[0]) for percentile, values in results.items()}
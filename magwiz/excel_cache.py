@@ -0,0 +1,115 @@
+import glob
+import os
+import shutil
+
+import pyarrow as pa
+
+from magwiz.excel_reader import count_excel_rows, get_excel_columns, iter_excel_chunks
+
+# Folder containing the columnar copies of the Excel files
+CACHE_FOLDER = os.path.join('.cache', 'excel')
+
+# Column holding the row number below the header in the Excel file
+POSITION_COLUMN = '_position'
+
+
+# Function to fetch the folder of the cached copy of an Excel file, keyed by the content hash computed by the sync
+# Copies of unchanged content are found again even when the file was saved or copied anew, such as when an
+# import is retried after it was cancelled or failed, or when a file is restored from a backup
+def get_cache_path(excel_path, file_hash, cache_folder=CACHE_FOLDER):
+    file_stem = os.path.splitext(os.path.basename(excel_path))[0]
+    return os.path.join(cache_folder, f"{file_stem}-{file_hash}")
+
+
+# Function to remove cached copies of an Excel file other than the given one
+# Temporary folders are left alone, since other workers may still be writing them
+def remove_stale_cache_files(cache_path):
+    file_stem = os.path.basename(cache_path).rsplit('-', 1)[0]
+    for path in glob.glob(os.path.join(os.path.dirname(cache_path), f"{glob.escape(file_stem)}-*")):
+        name = os.path.basename(path)
+        if path != cache_path and name.rsplit('-', 1)[0] == file_stem and not name.endswith('.tmp') and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# Function to list the Arrow files of a cached copy in row order
+def get_cache_parts(cache_path):
+    return sorted(glob.glob(os.path.join(cache_path, 'part-*.arrow')))
+
+
+# Function to stream the record batches of one Arrow file of a cached copy
+# Memory mapping lets the batches be read without copying the file into memory
+def iter_cache_batches(part_path):
+    with pa.memory_map(part_path) as source:
+        reader = pa.ipc.open_file(source)
+        for index in range(reader.num_record_batches):
+            yield reader.get_batch(index)
+
+
+# Function to write a chunk of Excel columns as one Arrow file
+# Each chunk gets its own file, so column types are inferred per chunk and may differ between chunks
+def write_cache_part(part_path, positions, values, columns):
+    data = {POSITION_COLUMN: positions}
+    for column, column_values in zip(columns, values):
+        data[str(column)] = column_values
+    table = pa.table(data)
+    with pa.OSFile(part_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+# Function to publish a complete cached copy under its final name
+# Workers parsing the same content at the same time all write a copy, and the first one published is kept
+def publish_cache(temp_path, cache_path):
+    if os.path.isdir(cache_path):
+        return
+    try:
+        os.replace(temp_path, cache_path)
+    except OSError:
+        if not os.path.isdir(cache_path):
+            raise
+        return
+    remove_stale_cache_files(cache_path)
+
+
+# Function to stream an Excel file in columnar chunks through its columnar cache
+# Each chunk is a (positions, values) pair, where positions are the row numbers below the header and values
+# holds one sequence per given column. A cached copy is read when one exists for the content hash, and then the
+# sequences are Arrow arrays read from the memory-mapped file; otherwise the Excel file is parsed, the sequences
+# are lists, and the cached copy is written along the way
+def iter_workbook_chunks(excel_path, file_hash, columns, cache_folder=CACHE_FOLDER):
+    cache_path = get_cache_path(excel_path, file_hash, cache_folder)
+    if os.path.isdir(cache_path):
+        for part_path in get_cache_parts(cache_path):
+            for batch in iter_cache_batches(part_path):
+                yield batch.column(POSITION_COLUMN), [batch.column(str(column)) for column in columns]
+        return
+
+    excel_columns = get_excel_columns(excel_path)
+    column_indexes = [excel_columns.index(column) for column in columns]
+
+    # The cache is written into a temporary folder and only renamed once complete
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    os.makedirs(temp_path, exist_ok=True)
+    caching = True
+    try:
+        for number, chunk in enumerate(iter_excel_chunks(excel_path, excel_columns)):
+            positions = [position for position, values in chunk]
+            values = [list(column_values) for column_values in zip(*(values for position, values in chunk))]
+            if caching:
+                try:
+                    write_cache_part(os.path.join(temp_path, f"part-{number:05d}.arrow"), positions, values, excel_columns)
+                except (pa.ArrowInvalid, pa.ArrowTypeError):
+                    # Columns mixing incompatible values are only read from Excel
+                    caching = False
+            yield positions, [values[index] for index in column_indexes]
+        if caching:
+            publish_cache(temp_path, cache_path)
+    finally:
+        shutil.rmtree(temp_path, ignore_errors=True)
+
+
+# Function to fetch the number of data rows of an Excel file, using its cached copy when available
+def count_workbook_rows(excel_path, file_hash, cache_folder=CACHE_FOLDER):
+    cache_path = get_cache_path(excel_path, file_hash, cache_folder)
+    if os.path.isdir(cache_path):
+        return sum(batch.num_rows for part_path in get_cache_parts(cache_path) for batch in iter_cache_batches(part_path))
+    return count_excel_rows(excel_path)
@@ -0,0 +1,55 @@
+from openpyxl import load_workbook
+
+# Number of rows passed on at once while streaming an Excel sheet
+CHUNK_SIZE = 5000
+
+
+# Function to fetch the number of data rows declared in the first sheet of an Excel file
+def count_excel_rows(excel_path):
+    workbook = load_workbook(excel_path, read_only=True)
+    try:
+        max_row = workbook.worksheets[0].max_row
+    finally:
+        workbook.close()
+    # The sheet dimension can be missing, in which case the row count is unknown
+    return max_row - 1 if max_row else None
+
+
+# Function to fetch the column names from the header row of an Excel file
+def get_excel_columns(excel_path):
+    workbook = load_workbook(excel_path, read_only=True)
+    try:
+        header = next(workbook.worksheets[0].iter_rows(max_row=1, values_only=True), ())
+    finally:
+        workbook.close()
+    return list(header)
+
+
+# Function to stream the first sheet of an Excel file in fixed-size chunks of rows
+# Each row is a (position, values) pair, where position is the row number below the header
+# and values are ordered like the given columns (all columns of the sheet by default)
+def iter_excel_chunks(excel_path, columns=None, chunk_size=CHUNK_SIZE):
+    # The read-only mode parses the sheet XML incrementally instead of loading the whole workbook
+    workbook = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        if columns is None:
+            columns = header
+        column_indexes = [header.index(column) for column in columns]
+
+        chunk = []
+        for position, row in enumerate(rows, start=1):
+            # Skip empty rows, e.g. formatted rows below the data
+            if all(value is None for value in row):
+                continue
+            chunk.append((position, tuple(row[index] if index < len(row) else None for index in column_indexes)))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
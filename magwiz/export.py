@@ -0,0 +1,128 @@
+import datetime
+import io
+import math
+import threading
+from collections import OrderedDict
+
+import xlsxwriter
+
+# File formats the reports can be downloaded in, with their file extension and MIME type
+EXPORT_FORMATS = {
+    'Excel': {'extension': 'xlsx', 'mime': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    'CSV': {'extension': 'csv', 'mime': "text/csv"},
+    'Parquet': {'extension': 'parquet', 'mime': "application/vnd.apache.parquet"}
+}
+
+# Name of the worksheet holding the report in Excel files
+EXCEL_SHEET_NAME = 'Sheet1'
+
+# Number of rows converted to cell values at a time while writing an Excel file
+EXCEL_CHUNK_ROWS = 10000
+
+# Memory budget of the cached export files, shared by all sessions of the app
+MAX_EXPORT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Generated files in least recently used order, keyed by report key and format
+_export_cache = OrderedDict()
+_export_cache_state = {'bytes': 0, 'data_version': None}
+_export_cache_lock = threading.Lock()
+
+
+# Function to convert a column to plain Python values, with None for missing values
+def to_cell_values(column):
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+# Function to write one value to a worksheet cell with the writer matching its type
+def write_cell(worksheet, row, col, value, date_format, datetime_format):
+    if value is None:
+        return
+    if isinstance(value, datetime.datetime):
+        worksheet.write_datetime(row, col, value, datetime_format)
+    elif isinstance(value, datetime.date):
+        worksheet.write_datetime(row, col, value, date_format)
+    elif isinstance(value, bool):
+        worksheet.write_boolean(row, col, value)
+    elif isinstance(value, (int, float)) and math.isfinite(value):
+        worksheet.write_number(row, col, value)
+    else:
+        # Texts are never read as formulas or links, and infinite numbers are written as text
+        worksheet.write_string(row, col, str(value))
+
+
+# Function to write a DataFrame to an Excel file
+# The workbook is written in constant memory mode, which streams each finished row to a temporary file, so the
+# size of the workbook in memory does not grow with the number of rows
+def write_excel(df, output):
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'remove_timezone': True})
+    worksheet = workbook.add_worksheet(EXCEL_SHEET_NAME)
+    header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+    date_format = workbook.add_format({'num_format': 'yyyy-mm-dd'})
+    datetime_format = workbook.add_format({'num_format': 'yyyy-mm-dd hh:mm:ss'})
+
+    # Rows must be written in order in constant memory mode
+    for col, name in enumerate(df.columns):
+        worksheet.write_string(0, col, str(name), header_format)
+    row = 1
+    for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+        for values in zip(*(to_cell_values(chunk.iloc[:, col]) for col in range(chunk.shape[1]))):
+            for col, value in enumerate(values):
+                write_cell(worksheet, row, col, value, date_format, datetime_format)
+            row += 1
+    workbook.close()
+
+
+# Function to generate the file of a DataFrame in one of the export formats
+def generate_export(df, export_format):
+    output = io.BytesIO()
+    if export_format == 'Excel':
+        write_excel(df, output)
+    elif export_format == 'CSV':
+        df.to_csv(output, index=False, encoding='utf-8')
+    elif export_format == 'Parquet':
+        df.to_parquet(output, index=False)
+    else:
+        raise ValueError(f"Unknown export format: {export_format}")
+    return output.getvalue()
+
+
+# Function to fetch the file of a report through the shared export cache, generating it if it is not cached
+# Files stay cached until an import changes the data version or they are evicted to stay within the memory budget
+def get_export(df, key, export_format, data_version):
+    cache_key = (key, export_format)
+    with _export_cache_lock:
+        if _export_cache_state['data_version'] != data_version:
+            # The data changed, so every cached file is stale
+            _export_cache.clear()
+            _export_cache_state['bytes'] = 0
+            _export_cache_state['data_version'] = data_version
+        elif cache_key in _export_cache:
+            _export_cache.move_to_end(cache_key)
+            return _export_cache[cache_key]
+
+    data = generate_export(df, export_format)
+    if len(data) > MAX_EXPORT_CACHE_BYTES:
+        return data
+
+    with _export_cache_lock:
+        # Another session may have cached the same file or bumped the version in the meantime
+        if _export_cache_state['data_version'] == data_version and cache_key not in _export_cache:
+            _export_cache[cache_key] = data
+            _export_cache_state['bytes'] += len(data)
+            while _export_cache_state['bytes'] > MAX_EXPORT_CACHE_BYTES:
+                evicted_data = _export_cache.popitem(last=False)[1]
+                _export_cache_state['bytes'] -= len(evicted_data)
+    return data
+
+
+# Function to prepare the arguments of a download button which generates the file of a report only when clicked
+# The key identifies the report by the settings it was loaded with, and together with the data version it
+# identifies the data of the DataFrame, so repeated downloads of the same report reuse the cached file
+def prepare_download(df, key, export_format, data_version, file_stem):
+    settings = EXPORT_FORMATS[export_format]
+    return {
+        'data': lambda: get_export(df, key, export_format, data_version),
+        'file_name': f"{file_stem}.{settings['extension']}",
+        'mime': settings['mime']
+    }
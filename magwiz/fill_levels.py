@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from magwiz.query_builder import build_where, in_values, is_not_null
+from magwiz.query_cache import read_query
+
+# Fill percentage from which a warehouse is considered full, as on the gauges of the fill levels page
+FULL_THRESHOLD = 90
+
+# Number of latest days of fill levels the projection trend is fitted to
+DEFAULT_TREND_DAYS = 30
+
+
+# Function to load the fill levels of the warehouses on every day as a time series, one column per warehouse
+# All days and warehouses come from the daily summary in one query, so comparing dates does not query again
+def load_fill_levels(conn, warehouses=None):
+    where_clause, params = build_where([
+        in_values('w.warehouse_name', warehouses) if warehouses else None,
+        is_not_null('d.fill_percentage')
+    ])
+    query = f"""
+        SELECT d.day, w.warehouse_name, d.fill_percentage
+        FROM DailyWarehouseSummary d
+        JOIN Warehouses w ON d.warehouse_id = w.warehouse_id
+        {where_clause}
+        ORDER BY d.day, w.warehouse_name
+    """
+    fill_levels = read_query(query, conn, params=params)
+    fill_levels = fill_levels.pivot(index='day', columns='warehouse_name', values='fill_percentage')
+    fill_levels.index = pd.to_datetime(fill_levels.index)
+    fill_levels.index.name = 'Date'
+    fill_levels.columns.name = 'Warehouse'
+    return fill_levels
+
+
+# Function to select the fill levels of some dates from the time series, one row per warehouse and one column per date
+def compare_dates(fill_levels, dates):
+    selected = fill_levels.reindex(pd.to_datetime(sorted(dates))).T
+    selected.columns = [date.date().isoformat() for date in selected.columns]
+    return selected
+
+
+# Function to fit a linear trend to the latest fill levels of every warehouse at once
+# Days without a snapshot of a warehouse are left out of its fit. Returns the slopes (percentage points
+# per day) and the fitted levels on the last day of the series
+def fit_linear_trends(fill_levels, trend_days=DEFAULT_TREND_DAYS):
+    recent = fill_levels[fill_levels.index > fill_levels.index.max() - pd.Timedelta(days=trend_days)]
+    values = recent.to_numpy(dtype=float)
+    days = ((recent.index - recent.index.max()) / pd.Timedelta(days=1)).to_numpy(dtype=float)[:, np.newaxis]
+    mask = ~np.isnan(values)
+
+    counts = mask.sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_days = np.where(mask, days, 0).sum(axis=0) / counts
+        mean_values = np.where(mask, values, 0).sum(axis=0) / counts
+        day_deviations = np.where(mask, days - mean_days, 0)
+        covariances = (day_deviations * np.where(mask, values - mean_values, 0)).sum(axis=0)
+        variances = (day_deviations ** 2).sum(axis=0)
+        slopes = np.where(variances > 0, covariances / variances, 0.0)
+    # The last day of the series is day 0, so the fitted level there is the intercept
+    last_levels = mean_values - slopes * mean_days
+    return slopes, last_levels
+
+
+# Function to project when each warehouse reaches the full threshold if its fill level keeps its linear trend
+# Warehouses already at the threshold are due today, and warehouses whose level does not grow are never due
+def project_threshold_crossings(fill_levels, threshold=FULL_THRESHOLD, trend_days=DEFAULT_TREND_DAYS):
+    if fill_levels.empty:
+        return pd.DataFrame(columns=['Warehouse', 'Latest Fill (%)', 'Trend (% per day)', 'Days Until Full', 'Projected Full Date'])
+
+    slopes, last_levels = fit_linear_trends(fill_levels, trend_days)
+    latest_levels = fill_levels.ffill().iloc[-1].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_until_full = np.where(
+            latest_levels >= threshold, 0.0,
+            np.where(slopes > 0, np.maximum(np.ceil((threshold - last_levels) / slopes), 0), np.nan)
+        )
+    last_date = fill_levels.index.max()
+    full_dates = last_date + pd.to_timedelta(days_until_full, unit='D')
+
+    return pd.DataFrame({
+        'Warehouse': fill_levels.columns,
+        'Latest Fill (%)': latest_levels,
+        'Trend (% per day)': slopes,
+        'Days Until Full': days_until_full,
+        'Projected Full Date': [date.date() if not pd.isna(date) else None for date in full_dates]
+    }).sort_values(['Days Until Full', 'Warehouse'], na_position='last').reset_index(drop=True)
@@ -0,0 +1,192 @@
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from magwiz.query_cache import get_data_version, read_query
+from magwiz.sales_index import to_day_number
+
+# Number of days of sales the daily demand rate is computed from
+DEFAULT_DEMAND_WINDOW_DAYS = 28
+
+# Number of days ahead in which projected stock-outs are reported
+DEFAULT_HORIZON_DAYS = 30
+
+# Service levels offered for the safety buffer, with the matching number of standard deviations of the normal distribution
+SERVICE_LEVELS = {
+    '90%': 1.28,
+    '95%': 1.65,
+    '99%': 2.33
+}
+DEFAULT_SERVICE_LEVEL = '95%'
+
+# Latest forecast, reused until the data version or the settings change
+_forecast_cache = {'key': None, 'forecast': None}
+_forecast_lock = threading.Lock()
+
+
+# Function to fetch the day the forecast starts from, which is the day of the latest stock snapshot
+def get_forecast_date(conn):
+    day = conn.execute("SELECT MAX(day) FROM DailyWarehouseSummary").fetchone()[0]
+    return datetime.date.fromisoformat(day) if day else None
+
+
+# Function to fetch the last day of the demand window, which is the day of the last order up to the forecast date
+# Orders and stock snapshots can end on different days, and the days after the last order have no recorded sales
+# rather than zero demand, so they are left out of the window
+def get_demand_end_date(conn, as_of_date):
+    day = conn.execute("SELECT DATE(MAX(order_date)) FROM Orders WHERE order_date < ?",
+                       ((as_of_date + datetime.timedelta(days=1)).isoformat(),)).fetchone()[0]
+    return datetime.date.fromisoformat(day) if day else as_of_date
+
+
+# Function to load the sum and sum of squares of the daily sales of each product in the days before a date (included)
+# Reads the daily sales index, so the cost depends on the number of products and days rather than on the order lines
+def load_demand_sums(conn, end_date, window_days):
+    query = """
+        SELECT product_code, SUM(quantity) AS total_quantity, SUM(quantity * quantity) AS total_squares
+        FROM ProductDailySales
+        WHERE day > ? AND day <= ?
+        GROUP BY product_code
+    """
+    end_day = to_day_number(end_date)
+    return read_query(query, conn, params=[end_day - window_days, end_day])
+
+
+# Function to load the lead time statistics of each supplier, in days from order to delivery
+def load_supplier_lead_times(conn):
+    query = """
+        SELECT
+            d.supplier_id,
+            s.supplier_name,
+            COUNT(*) AS deliveries,
+            AVG(julianday(d.delivery_date) - julianday(d.order_date)) AS mean_lead_time,
+            AVG((julianday(d.delivery_date) - julianday(d.order_date)) * (julianday(d.delivery_date) - julianday(d.order_date))) AS mean_squares,
+            MIN(julianday(d.delivery_date) - julianday(d.order_date)) AS min_lead_time,
+            MAX(julianday(d.delivery_date) - julianday(d.order_date)) AS max_lead_time
+        FROM Deliveries d
+        LEFT JOIN Suppliers s ON d.supplier_id = s.supplier_id
+        WHERE d.delivery_date IS NOT NULL AND d.order_date IS NOT NULL
+        GROUP BY d.supplier_id
+    """
+    lead_times = read_query(query, conn)
+    lead_times['std_lead_time'] = np.sqrt(np.maximum(lead_times['mean_squares'] - lead_times['mean_lead_time'] ** 2, 0))
+    return lead_times.drop(columns=['mean_squares'])
+
+
+# Function to load the supplier of the latest delivery of each product
+def load_product_suppliers(conn):
+    query = """
+        SELECT product_code, supplier_id
+        FROM (
+            SELECT
+                dd.product_code,
+                d.supplier_id,
+                ROW_NUMBER() OVER (PARTITION BY dd.product_code ORDER BY d.order_date DESC, d.delivery_id DESC) AS position
+            FROM DeliveryDetails dd
+            JOIN Deliveries d ON dd.delivery_id = d.delivery_id
+            WHERE dd.product_code IS NOT NULL
+        )
+        WHERE position = 1
+    """
+    return read_query(query, conn)
+
+
+# Function to load the available quantity of each product, summed over the latest snapshot of every warehouse
+def load_current_stock(conn):
+    query = """
+        SELECT product_code, SUM(quantity_available) AS quantity_available
+        FROM (
+            SELECT
+                product_code,
+                quantity_available,
+                ROW_NUMBER() OVER (PARTITION BY product_code, warehouse_id ORDER BY stock_day DESC, stock_id DESC) AS position
+            FROM WarehouseStock
+            WHERE product_code IS NOT NULL
+        )
+        WHERE position = 1
+        GROUP BY product_code
+    """
+    return read_query(query, conn)
+
+
+# Function to compute the reorder point, days of cover and projected dates of every stocked product at once
+# The reorder point is the expected demand during the supplier lead time plus a safety buffer, which is the larger
+# of the configured safety stock and the buffer covering the variability of both demand and lead time
+def compute_forecast(conn, as_of_date, window_days=DEFAULT_DEMAND_WINDOW_DAYS, service_level=DEFAULT_SERVICE_LEVEL):
+    stock = load_current_stock(conn)
+    products = read_query("SELECT product_code, product_name, safety_stock FROM Products", conn)
+    forecast = stock.merge(products, on='product_code', how='left')
+    demand_end_date = get_demand_end_date(conn, as_of_date)
+    forecast = forecast.merge(load_demand_sums(conn, demand_end_date, window_days), on='product_code', how='left')
+    forecast = forecast.merge(load_product_suppliers(conn), on='product_code', how='left')
+    lead_times = load_supplier_lead_times(conn)
+    forecast = forecast.merge(lead_times[['supplier_id', 'supplier_name', 'mean_lead_time', 'std_lead_time']], on='supplier_id', how='left')
+
+    # Daily demand, counting the days without sales as zero demand
+    total_quantities = forecast['total_quantity'].fillna(0).to_numpy(dtype=float)
+    demand_rates = total_quantities / window_days
+    demand_variances = np.maximum(forecast['total_squares'].fillna(0).to_numpy(dtype=float) / window_days - demand_rates ** 2, 0)
+
+    # Products never delivered get the lead time of all deliveries
+    overall_lead_time = np.average(lead_times['mean_lead_time'], weights=lead_times['deliveries']) if len(lead_times) else 0.0
+    mean_lead_times = forecast['mean_lead_time'].fillna(overall_lead_time).to_numpy(dtype=float)
+    std_lead_times = forecast['std_lead_time'].fillna(0).to_numpy(dtype=float)
+
+    quantities = forecast['quantity_available'].fillna(0).to_numpy(dtype=float)
+    safety_stocks = forecast['safety_stock'].fillna(0).to_numpy(dtype=float)
+    lead_time_demands = demand_rates * mean_lead_times
+    buffers = SERVICE_LEVELS[service_level] * np.sqrt(mean_lead_times * demand_variances + demand_rates ** 2 * std_lead_times ** 2)
+    reorder_points = lead_time_demands + np.maximum(safety_stocks, buffers)
+
+    # Days until the stock runs out and until it reaches the reorder point, at the current demand rate
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(demand_rates > 0, quantities / demand_rates, np.inf)
+        days_to_reorder = np.where(demand_rates > 0, np.maximum((quantities - reorder_points) / demand_rates, 0), np.inf)
+    as_of = pd.Timestamp(as_of_date)
+    stock_out_dates = as_of + pd.to_timedelta(np.where(np.isfinite(days_of_cover), np.floor(days_of_cover), np.nan), unit='D')
+    reorder_dates = as_of + pd.to_timedelta(np.where(np.isfinite(days_to_reorder), np.floor(days_to_reorder), np.nan), unit='D')
+
+    return pd.DataFrame({
+        'Product Code': forecast['product_code'],
+        'Product Name': forecast['product_name'],
+        'Supplier': forecast['supplier_name'],
+        'Quantity Available': quantities.astype('int64'),
+        'Safety Stock': safety_stocks.astype('int64'),
+        'Daily Demand': demand_rates,
+        'Lead Time (days)': mean_lead_times,
+        'Reorder Point': np.ceil(reorder_points).astype('int64'),
+        'Days of Cover': days_of_cover,
+        'Reorder Date': reorder_dates.date,
+        'Stock-out Date': stock_out_dates.date,
+        'Reorder Now': (quantities <= reorder_points) & (reorder_points > 0)
+    })
+
+
+# Function to fetch the forecast of all stocked products, computed again only when the data or the settings change
+def get_forecast(conn, window_days=DEFAULT_DEMAND_WINDOW_DAYS, service_level=DEFAULT_SERVICE_LEVEL):
+    as_of_date = get_forecast_date(conn)
+    key = (get_data_version(conn), as_of_date, window_days, service_level)
+    with _forecast_lock:
+        if _forecast_cache['key'] == key:
+            return as_of_date, _forecast_cache['forecast'].copy()
+
+    forecast = compute_forecast(conn, as_of_date or datetime.date.today(), window_days, service_level)
+
+    with _forecast_lock:
+        _forecast_cache['key'] = key
+        _forecast_cache['forecast'] = forecast
+    return as_of_date, forecast.copy()
+
+
+# Function to select the products projected to run out of stock within a horizon, the closest to running out first
+# Products without demand have infinite days of cover, so they are never projected to run short
+def find_projected_shortages(forecast, horizon_days=DEFAULT_HORIZON_DAYS):
+    projected = forecast[forecast['Days of Cover'] <= horizon_days]
+    return projected.sort_values(['Days of Cover', 'Product Name']).reset_index(drop=True)
+
+
+# Function to prepare the projected shortages for display and download, rounded to meaningful precision
+def format_forecast_report(projected):
+    return projected.drop(columns=['Product Code']).round({'Daily Demand': 2, 'Lead Time (days)': 1, 'Days of Cover': 1})
@@ -0,0 +1,73 @@
+import copy
+import functools
+import math
+
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+# Colour bands of the gauges: each colour applies from its threshold up to the next one
+GAUGE_SCHEMES = {
+    # Higher is better, such as the share of records completed on time
+    'timeliness': {'thresholds': [0, 50, 75, 100], 'colors': ["red", "orange", "green"]},
+    # Lower is better, such as the fill level of a warehouse
+    'fill_level': {'thresholds': [0, 50, 90, 100], 'colors': ["green", "orange", "red"]}
+}
+
+# Height in pixels of one row of gauges
+GAUGE_ROW_HEIGHT = 300
+
+
+# Function to find the color of a value from the colour bands of a gauge
+def find_color(value, thresholds, colors):
+    for i in range(len(thresholds) - 1):
+        if thresholds[i] <= value < thresholds[i + 1]:
+            return colors[i]
+    return colors[-1]
+
+
+# Function to build the base figure of a grid of gauges, with the layout and styling shared by all values
+# The figure only depends on the grid size, so it is built once per size and kept as a plain dictionary,
+# which is much cheaper to copy and patch than the figure objects
+@functools.lru_cache(maxsize=32)
+def build_gauge_template(num_gauges, num_columns):
+    num_rows = math.ceil(num_gauges / num_columns)
+    fig = make_subplots(
+        rows=num_rows,
+        cols=num_columns,
+        specs=[[{'type': 'indicator'}] * num_columns for _ in range(num_rows)]
+    )
+    for index in range(num_gauges):
+        fig.add_trace(go.Indicator(
+            mode="gauge+number",
+            value=0,
+            gauge={
+                'axis': {'range': [None, 100], 'tickfont': {'color': 'black'}, 'tickvals': list(range(0, 101, 10))},
+                'bgcolor': 'white',
+                'bar': {'color': 'gray'},
+                'borderwidth': 2,
+                'bordercolor': "gray",
+                'threshold': {
+                    'line': {'color': "black", 'width': 11},
+                    'thickness': 0.9,
+                    'value': 0}
+            }
+        ), row=index // num_columns + 1, col=index % num_columns + 1)
+    fig.update_layout(font={'color': "white", 'family': "Arial"}, height=num_rows * GAUGE_ROW_HEIGHT)
+    return fig.to_dict()
+
+
+# Function to create one figure holding a gauge for every value, laid out in a grid
+# Only the values, titles and colours are set on a copy of the cached base figure
+def create_gauge_grid(values, titles, scheme, num_columns=3):
+    values = list(values)
+    num_columns = max(min(num_columns, len(values)), 1)
+    fig = copy.deepcopy(build_gauge_template(len(values), num_columns))
+    thresholds, colors = GAUGE_SCHEMES[scheme]['thresholds'], GAUGE_SCHEMES[scheme]['colors']
+    for trace, value, title in zip(fig['data'], values, titles):
+        color = find_color(value, thresholds, colors)
+        trace['value'] = value
+        trace['title'] = {'text': title, 'font': {'color': 'black'}}
+        trace['number'] = {'font': {'color': color}}
+        trace['gauge']['bar']['color'] = color
+        trace['gauge']['threshold']['value'] = value
+    return go.Figure(fig)
@@ -0,0 +1,241 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+
+from magwiz.data_sync import DATA_FOLDER, EXCEL_FILES, ImportCancelled, update_data
+from magwiz.db import BUSY_TIMEOUT, DB_PATH, get_connection
+
+# Statuses of an import job
+JOB_RUNNING = 'running'
+JOB_COMPLETED = 'completed'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+
+# Statuses of the tables of an import job, from waiting for their workbook to being applied
+TABLE_WAITING = 'waiting'
+TABLE_READING = 'reading'
+TABLE_READ = 'read'
+TABLE_APPLIED = 'applied'
+TABLE_UNCHANGED = 'unchanged'
+TABLE_STOPPED = 'stopped'
+TABLE_ROLLED_BACK = 'rolled back'
+
+# Seconds between two writes of the reading progress of a table
+PROGRESS_WRITE_INTERVAL = 0.5
+
+# Import jobs running in this process, keyed by job id, with the events cancelling them
+_running_jobs = {}
+_running_jobs_lock = threading.Lock()
+
+
+# Function to fetch the path of the database holding the import jobs of a database
+# The jobs are kept in their own file, so their progress can be written and read while an import
+# holds the write lock of the main database
+def get_jobs_db_path(db_path=DB_PATH):
+    return os.path.splitext(db_path)[0] + '_jobs.db'
+
+
+# Function to create the tables storing the import jobs and the progress of their tables
+def ensure_job_tables(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ImportJobs (
+            job_id INTEGER PRIMARY KEY,
+            status TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            finished_at TEXT,
+            messages TEXT NOT NULL DEFAULT '',
+            error TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ImportJobTables (
+            job_id INTEGER NOT NULL,
+            table_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            rows_read INTEGER NOT NULL DEFAULT 0,
+            total_rows INTEGER,
+            rows_per_second REAL,
+            added INTEGER,
+            updated INTEGER,
+            deleted INTEGER,
+            PRIMARY KEY (job_id, table_name)
+        ) WITHOUT ROWID
+    """)
+    conn.commit()
+
+
+# Function to open a connection to the database of the import jobs
+def open_jobs_connection(db_path=DB_PATH):
+    conn = sqlite3.connect(get_jobs_db_path(db_path), timeout=BUSY_TIMEOUT, check_same_thread=False)
+    # Pages read the progress while the job thread writes it
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    ensure_job_tables(conn)
+    return conn
+
+
+# Function to fetch the current time as stored in the job tables
+def get_timestamp():
+    return datetime.datetime.now().isoformat(' ', 'seconds')
+
+
+# Function to create a job and the rows of its tables
+def create_job(jobs_conn):
+    with jobs_conn:
+        job_id = jobs_conn.execute(
+            "INSERT INTO ImportJobs (status, started_at) VALUES (?, ?)", (JOB_RUNNING, get_timestamp())
+        ).lastrowid
+        jobs_conn.executemany(
+            "INSERT INTO ImportJobTables (job_id, table_name, position, status) VALUES (?, ?, ?, ?)",
+            [(job_id, table_name, position, TABLE_WAITING) for position, table_name in enumerate(EXCEL_FILES.values())]
+        )
+    return job_id
+
+
+# Function to create the callbacks of an import which store its messages and progress in the job tables
+def create_job_callbacks(jobs_conn, job_id):
+    last_written = {}
+
+    def report(message):
+        with jobs_conn:
+            jobs_conn.execute("UPDATE ImportJobs SET messages = messages || ? || char(10) WHERE job_id = ?", (message, job_id))
+
+    def progress(table_name, rows_done, total_rows, rows_per_second):
+        done = bool(total_rows) and rows_done >= total_rows
+        # Progress is written at most every half second per table, and always once the workbook is read
+        if not done and time.perf_counter() - last_written.get(table_name, 0.0) < PROGRESS_WRITE_INTERVAL:
+            return
+        last_written[table_name] = time.perf_counter()
+        with jobs_conn:
+            jobs_conn.execute("""
+                UPDATE ImportJobTables SET status = ?, rows_read = ?, total_rows = ?, rows_per_second = ?
+                WHERE job_id = ? AND table_name = ?
+            """, (TABLE_READ if done else TABLE_READING, rows_done, total_rows, rows_per_second, job_id, table_name))
+
+    def on_result(table_name, result):
+        with jobs_conn:
+            jobs_conn.execute("""
+                UPDATE ImportJobTables SET status = ?, added = ?, updated = ?, deleted = ?
+                WHERE job_id = ? AND table_name = ?
+            """, (TABLE_APPLIED, result['added'], result['updated'], result['deleted'], job_id, table_name))
+
+    return report, progress, on_result
+
+
+# Function to record the end of a job
+# Tables already applied by a failed or cancelled job were rolled back with the whole import
+def finish_job(jobs_conn, job_id, status, error=None):
+    with jobs_conn:
+        jobs_conn.execute("UPDATE ImportJobs SET status = ?, finished_at = ?, error = ? WHERE job_id = ?",
+                          (status, get_timestamp(), error, job_id))
+        if status == JOB_COMPLETED:
+            jobs_conn.execute("UPDATE ImportJobTables SET status = ? WHERE job_id = ? AND status = ?",
+                              (TABLE_UNCHANGED, job_id, TABLE_WAITING))
+        else:
+            jobs_conn.execute("UPDATE ImportJobTables SET status = ? WHERE job_id = ? AND status = ?",
+                              (TABLE_ROLLED_BACK, job_id, TABLE_APPLIED))
+            jobs_conn.execute("UPDATE ImportJobTables SET status = ? WHERE job_id = ? AND status IN (?, ?)",
+                              (TABLE_STOPPED, job_id, TABLE_READING, TABLE_READ))
+
+
+# Function to run an import job, storing its messages, progress and result in the job tables
+def run_import_job(job_id, cancel_event, db_path=DB_PATH, folder_path=DATA_FOLDER):
+    jobs_conn = open_jobs_connection(db_path)
+    try:
+        report, progress, on_result = create_job_callbacks(jobs_conn, job_id)
+        try:
+            with get_connection(read_only=False, db_path=db_path) as conn:
+                update_data(conn, folder_path=folder_path, report=report, progress=progress, on_result=on_result,
+                            cancel_event=cancel_event)
+        except ImportCancelled:
+            finish_job(jobs_conn, job_id, JOB_CANCELLED, "The import was cancelled, no data was changed.")
+        except Exception as error:
+            finish_job(jobs_conn, job_id, JOB_FAILED, f"{type(error).__name__}: {error}")
+        else:
+            finish_job(jobs_conn, job_id, JOB_COMPLETED)
+    finally:
+        jobs_conn.close()
+        with _running_jobs_lock:
+            _running_jobs.pop(job_id, None)
+
+
+# Function to start an import in a background thread and return the id of its job
+# Only one import runs at a time in a process, so the id of the running job is returned when there is one
+def start_import_job(db_path=DB_PATH, folder_path=DATA_FOLDER):
+    with _running_jobs_lock:
+        if _running_jobs:
+            return next(iter(_running_jobs))
+
+        jobs_conn = open_jobs_connection(db_path)
+        try:
+            job_id = create_job(jobs_conn)
+        finally:
+            jobs_conn.close()
+        cancel_event = threading.Event()
+        _running_jobs[job_id] = cancel_event
+
+    # The thread is a daemon, so stopping the app does not wait for the import, whose transaction is then rolled back
+    thread = threading.Thread(target=run_import_job, args=(job_id, cancel_event, db_path, folder_path),
+                              name=f"import-job-{job_id}", daemon=True)
+    thread.start()
+    return job_id
+
+
+# Function to request the cancellation of a job running in this process
+def cancel_import_job(job_id):
+    with _running_jobs_lock:
+        cancel_event = _running_jobs.get(job_id)
+    if cancel_event is None:
+        return False
+    cancel_event.set()
+    return True
+
+
+# Function to check if a job is running in this process
+def is_job_running(job_id):
+    with _running_jobs_lock:
+        return job_id in _running_jobs
+
+
+# Function to load a job, or None when it does not exist
+def load_job(job_id, db_path=DB_PATH):
+    jobs_conn = open_jobs_connection(db_path)
+    try:
+        row = jobs_conn.execute(
+            "SELECT job_id, status, started_at, finished_at, messages, error FROM ImportJobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+    finally:
+        jobs_conn.close()
+    if row is None:
+        return None
+    return dict(zip(['job_id', 'status', 'started_at', 'finished_at', 'messages', 'error'], row))
+
+
+# Function to load the id of the latest job, or None when no import was started yet
+def get_latest_job_id(db_path=DB_PATH):
+    jobs_conn = open_jobs_connection(db_path)
+    try:
+        row = jobs_conn.execute("SELECT MAX(job_id) FROM ImportJobs").fetchone()
+    finally:
+        jobs_conn.close()
+    return row[0]
+
+
+# Function to load the progress of the tables of a job, in the order of the Excel files
+# Progress changes all the time, so it is read directly instead of through the query cache
+def load_job_tables(job_id, db_path=DB_PATH):
+    jobs_conn = open_jobs_connection(db_path)
+    try:
+        return pd.read_sql_query("""
+            SELECT table_name, status, rows_read, total_rows, rows_per_second, added, updated, deleted
+            FROM ImportJobTables
+            WHERE job_id = ?
+            ORDER BY position
+        """, jobs_conn, params=[job_id])
+    finally:
+        jobs_conn.close()
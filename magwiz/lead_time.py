@@ -0,0 +1,136 @@
+import datetime
+
+import numpy as np
+
+from magwiz.query_cache import read_query
+from magwiz.timeliness import TIMELINESS_KINDS
+
+# Lengths in days of the rolling windows of average lead times
+ROLLING_WINDOWS = [7, 30]
+
+# Expression of the lead time in days, from the order to the delivery or shipment
+LEAD_TIME_EXPRESSION = "julianday(t.{actual_column}) - julianday(t.order_date)"
+
+
+# Function to build the condition selecting the completed records ordered between two dates (both included)
+# The dates are compared with the stored order dates, so the rows are read with a range scan of the order date index
+def get_range_condition(kind, start_date, end_date):
+    settings = TIMELINESS_KINDS[kind]
+    condition = f"t.order_date >= ? AND t.order_date < ? AND t.{settings['actual_column']} IS NOT NULL"
+    return condition, [start_date.isoformat(), (end_date + datetime.timedelta(days=1)).isoformat()]
+
+
+# Function to load the deliveries or shipments ordered between two dates with their lead time
+def load_lead_time_records(conn, kind, start_date, end_date):
+    settings = TIMELINESS_KINDS[kind]
+    condition, params = get_range_condition(kind, start_date, end_date)
+    query = f"""
+        SELECT
+            t.{settings['id_column']} AS '{settings['number_label']}',
+            p.{settings['party_name_column']} AS '{settings['party_label']}',
+            DATE(t.order_date) AS 'Order Date',
+            DATE(t.{settings['actual_column']}) AS '{settings['actual_label']}',
+            {LEAD_TIME_EXPRESSION.format(**settings)} AS 'Lead Time (days)'
+        FROM {settings['table']} t
+        JOIN {settings['party_table']} p ON t.{settings['party_id_column']} = p.{settings['party_id_column']}
+        WHERE {condition}
+    """
+    return read_query(query, conn, params=params)
+
+
+# Function to compute the lead time statistics of each supplier or customer between two dates in one query
+# Medians are read from the ranks of the lead times within each party, and the rolling averages cover the
+# last days of the period
+def load_lead_time_statistics(conn, kind, start_date, end_date):
+    settings = TIMELINESS_KINDS[kind]
+    condition, params = get_range_condition(kind, start_date, end_date)
+    rolling_columns = ',\n'.join(
+        f"AVG(CASE WHEN day > -{window_days} THEN lead_time END) AS 'Rolling {window_days}-day Average'"
+        for window_days in ROLLING_WINDOWS
+    )
+    query = f"""
+        WITH lead_times AS (
+            SELECT
+                t.{settings['party_id_column']} AS party_id,
+                julianday(DATE(t.order_date)) - julianday(?) AS day,
+                {LEAD_TIME_EXPRESSION.format(**settings)} AS lead_time
+            FROM {settings['table']} t
+            WHERE {condition}
+        ),
+        ranked AS (
+            SELECT
+                party_id,
+                day,
+                lead_time,
+                ROW_NUMBER() OVER (PARTITION BY party_id ORDER BY lead_time) AS position,
+                COUNT(*) OVER (PARTITION BY party_id) AS records
+            FROM lead_times
+        )
+        SELECT
+            p.{settings['party_name_column']} AS '{settings['party_label']}',
+            COUNT(*) AS 'Records',
+            AVG(lead_time) AS 'Mean',
+            AVG(CASE WHEN position IN ((records + 1) / 2, (records + 2) / 2) THEN lead_time END) AS 'Median',
+            MIN(lead_time) AS 'Minimum',
+            MAX(lead_time) AS 'Maximum',
+            SUM(lead_time * lead_time) AS sum_of_squares,
+            {rolling_columns}
+        FROM ranked r
+        JOIN {settings['party_table']} p ON r.party_id = p.{settings['party_id_column']}
+        GROUP BY r.party_id
+        ORDER BY p.{settings['party_name_column']}
+    """
+    # Days are counted from the end of the period, so the rolling windows end on its last day
+    statistics = read_query(query, conn, params=[end_date.isoformat()] + params)
+
+    # Sample standard deviation from the sums computed by the database
+    counts = statistics['Records'].to_numpy(dtype=float)
+    means = statistics['Mean'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variances = np.maximum(statistics['sum_of_squares'].to_numpy(dtype=float) - counts * means ** 2, 0) / (counts - 1)
+    statistics.insert(statistics.columns.get_loc('sum_of_squares'), 'Standard Deviation', np.where(counts > 1, np.sqrt(variances), np.nan))
+    # Parties without records in a rolling window get no average
+    for window_days in ROLLING_WINDOWS:
+        statistics[f"Rolling {window_days}-day Average"] = statistics[f"Rolling {window_days}-day Average"].astype(float)
+    return statistics.drop(columns=['sum_of_squares'])
+
+
+# Function to load the daily average lead time between two dates with its rolling averages, for the trend chart
+# One point per day is returned whatever the number of records, and the days before the period are read
+# so that the rolling averages of its first days are complete
+def load_lead_time_trend(conn, kind, start_date, end_date):
+    settings = TIMELINESS_KINDS[kind]
+    condition, params = get_range_condition(kind, start_date - datetime.timedelta(days=max(ROLLING_WINDOWS) - 1), end_date)
+    rolling_columns = ',\n'.join(
+        f"""SUM(total_lead_time) OVER (ORDER BY day RANGE BETWEEN {window_days - 1} PRECEDING AND CURRENT ROW)
+            / SUM(records) OVER (ORDER BY day RANGE BETWEEN {window_days - 1} PRECEDING AND CURRENT ROW) AS 'Rolling {window_days}-day Average'"""
+        for window_days in ROLLING_WINDOWS
+    )
+    query = f"""
+        WITH daily AS (
+            SELECT
+                CAST(julianday(DATE(t.order_date)) AS INTEGER) AS day,
+                DATE(t.order_date) AS order_day,
+                SUM({LEAD_TIME_EXPRESSION.format(**settings)}) AS total_lead_time,
+                COUNT(*) AS records
+            FROM {settings['table']} t
+            WHERE {condition}
+            GROUP BY DATE(t.order_date)
+        )
+        SELECT * FROM (
+            SELECT
+                order_day AS 'Order Date',
+                total_lead_time / records AS 'Daily Average',
+                {rolling_columns}
+            FROM daily
+        )
+        WHERE "Order Date" >= ?
+        ORDER BY "Order Date"
+    """
+    return read_query(query, conn, params=params + [start_date.isoformat()])
+
+
+# Function to compute the average lead time of all records from the statistics of the parties
+def get_overall_mean(statistics):
+    total_records = statistics['Records'].sum()
+    return (statistics['Mean'] * statistics['Records']).sum() / total_records if total_records else np.nan
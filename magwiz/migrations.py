@@ -0,0 +1,319 @@
+from magwiz.daily_summary import refresh_daily_summary
+from magwiz.delay_histogram import refresh_delay_histogram
+from magwiz.sales_index import refresh_channel_sales, refresh_product_sales
+from magwiz.shortage_alerts import refresh_shortage_events
+
+# Column definitions of the tables filled from the Excel files
+TABLE_DEFINITIONS = {
+    'Suppliers': """
+        supplier_id INTEGER PRIMARY KEY,
+        supplier_name TEXT NOT NULL
+    """,
+    'Products': """
+        product_code INTEGER PRIMARY KEY,
+        product_name TEXT NOT NULL,
+        safety_stock INTEGER,
+        unit_height INTEGER,
+        unit_width INTEGER,
+        unit_depth INTEGER,
+        unit_volume DECIMAL(5, 2)
+    """,
+    'Warehouses': """
+        warehouse_id INTEGER PRIMARY KEY,
+        warehouse_name TEXT NOT NULL,
+        capacity INTEGER
+    """,
+    'WarehouseStock': """
+        stock_id INTEGER PRIMARY KEY,
+        stock_date DATE,
+        product_code INTEGER,
+        warehouse_id INTEGER,
+        quantity_on_hand INTEGER,
+        quantity_reserved INTEGER,
+        quantity_available INTEGER,
+        FOREIGN KEY (product_code) REFERENCES Products(product_code),
+        FOREIGN KEY (warehouse_id) REFERENCES Warehouses(warehouse_id)
+    """,
+    'Customers': """
+        customer_id INTEGER PRIMARY KEY,
+        customer_name TEXT NOT NULL
+    """,
+    'Orders': """
+        order_id INTEGER PRIMARY KEY,
+        customer_id INTEGER,
+        order_date DATE,
+        expected_shipping_date DATE,
+        shipping_date DATE,
+        shipping_status TEXT,
+        sales_channel TEXT,
+        FOREIGN KEY (customer_id) REFERENCES Customers(customer_id)
+    """,
+    'OrderDetails': """
+        order_product_id INTEGER PRIMARY KEY,
+        order_id INTEGER,
+        product_code INTEGER,
+        quantity INTEGER,
+        FOREIGN KEY (order_id) REFERENCES Orders(order_id),
+        FOREIGN KEY (product_code) REFERENCES Products(product_code)
+    """,
+    'Deliveries': """
+        delivery_id INTEGER PRIMARY KEY,
+        supplier_id INTEGER,
+        order_date DATE,
+        expected_delivery_date DATE,
+        delivery_date DATE,
+        delivery_status TEXT,
+        FOREIGN KEY (supplier_id) REFERENCES Suppliers(supplier_id)
+    """,
+    'DeliveryDetails': """
+        delivery_detail_id INTEGER PRIMARY KEY,
+        delivery_id INTEGER,
+        product_code INTEGER,
+        quantity INTEGER,
+        FOREIGN KEY (delivery_id) REFERENCES Deliveries(delivery_id),
+        FOREIGN KEY (product_code) REFERENCES Products(product_code)
+    """
+}
+
+# Indexes used by the filters and joins of the pages
+# Trailing columns make the indexes covering, so the hot queries never read the table rows
+INDEXES = {
+    'idx_warehouse_stock_day': "WarehouseStock (stock_day, warehouse_id, product_code, quantity_available)",
+    'idx_warehouse_stock_warehouse': "WarehouseStock (warehouse_id, stock_day, product_code, quantity_available)",
+    'idx_warehouse_stock_product': "WarehouseStock (product_code, quantity_available)",
+    'idx_orders_customer': "Orders (customer_id)",
+    'idx_orders_order_date': "Orders (order_date)",
+    'idx_order_details_order': "OrderDetails (order_id, product_code, quantity)",
+    'idx_order_details_product': "OrderDetails (product_code)",
+    'idx_deliveries_supplier': "Deliveries (supplier_id)",
+    'idx_deliveries_order_date': "Deliveries (order_date)",
+    'idx_delivery_details_delivery': "DeliveryDetails (delivery_id, product_code, quantity)",
+    'idx_delivery_details_product': "DeliveryDetails (product_code)"
+}
+
+
+# Function to check whether a table exists
+def table_exists(conn, table_name):
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+    return row is not None
+
+
+# Function to check whether a table still has its primary key
+def has_primary_key(conn, table_name):
+    return any(row[5] for row in conn.execute(f"PRAGMA table_info({table_name})"))
+
+
+# Function to rebuild a table with its declared columns and constraints, keeping the first row of duplicated keys
+def rebuild_table(conn, table_name):
+    rebuilt_name = f"{table_name}_rebuilt"
+    conn.execute(f"DROP TABLE IF EXISTS {rebuilt_name}")
+    conn.execute(f"CREATE TABLE {rebuilt_name} ({TABLE_DEFINITIONS[table_name]})")
+
+    old_columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({rebuilt_name})") if row[1] in old_columns]
+    column_list = ', '.join(columns)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO {rebuilt_name} ({column_list})
+        SELECT {column_list} FROM {table_name} ORDER BY rowid
+    """)
+
+    conn.execute(f"DROP TABLE {table_name}")
+    conn.execute(f"ALTER TABLE {rebuilt_name} RENAME TO {table_name}")
+
+
+# Migration 1: create the tables, and rebuild tables which lost their primary key
+# (older versions of the app replaced the tables with pandas, which drops all constraints)
+def create_tables(conn):
+    for table_name, definition in TABLE_DEFINITIONS.items():
+        if not table_exists(conn, table_name):
+            conn.execute(f"CREATE TABLE {table_name} ({definition})")
+        elif not has_primary_key(conn, table_name):
+            rebuild_table(conn, table_name)
+
+
+# Migration 2: add the day of each stock snapshot, so pages can filter on it without calling DATE()
+# The column is computed by SQLite, so imports never write it and it is stored in the indexes built on it
+def add_stock_day(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_xinfo(WarehouseStock)")]
+    if 'stock_day' not in columns:
+        conn.execute("ALTER TABLE WarehouseStock ADD COLUMN stock_day TEXT GENERATED ALWAYS AS (DATE(stock_date)) VIRTUAL")
+
+
+# Migration 3: create the indexes of the hot queries and collect statistics for the query planner
+def create_indexes(conn):
+    for index_name, definition in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {definition}")
+    conn.execute("ANALYZE")
+
+
+# Migration 4: create the summary of the stock snapshots per day and warehouse, filled from the existing snapshots
+def create_daily_summary(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS DailyWarehouseSummary (
+            day TEXT NOT NULL,
+            warehouse_id INTEGER NOT NULL,
+            total_quantity INTEGER,
+            total_volume REAL,
+            fill_percentage REAL,
+            sku_count INTEGER,
+            PRIMARY KEY (day, warehouse_id)
+        ) WITHOUT ROWID
+    """)
+    refresh_daily_summary(conn)
+
+
+# Migration 5: create the index of daily sales with their running total per product, filled from the existing orders
+def create_product_daily_sales(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ProductDailySales (
+            product_code INTEGER NOT NULL,
+            day INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            cum_quantity INTEGER NOT NULL,
+            PRIMARY KEY (product_code, day)
+        ) WITHOUT ROWID
+    """)
+    refresh_product_sales(conn)
+
+
+# Migration 6: create the trigram full-text index of product names, kept up to date by triggers on Products
+def create_product_search(conn):
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS ProductSearch USING fts5(
+            product_name,
+            content='Products',
+            content_rowid='product_code',
+            tokenize='trigram'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON Products BEGIN
+            INSERT INTO ProductSearch (rowid, product_name) VALUES (new.product_code, new.product_name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON Products BEGIN
+            INSERT INTO ProductSearch (ProductSearch, rowid, product_name) VALUES ('delete', old.product_code, old.product_name);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF product_code, product_name ON Products BEGIN
+            INSERT INTO ProductSearch (ProductSearch, rowid, product_name) VALUES ('delete', old.product_code, old.product_name);
+            INSERT INTO ProductSearch (rowid, product_name) VALUES (new.product_code, new.product_name);
+        END
+    """)
+    # Index the products which already exist
+    conn.execute("INSERT INTO ProductSearch (ProductSearch) VALUES ('rebuild')")
+
+
+# Migration 7: create the shortage alerts, opened and resolved as the stock snapshots of each product and warehouse
+# cross the safety stock, and evaluate the existing snapshots
+def create_shortage_events(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ShortageEvents (
+            event_id INTEGER PRIMARY KEY,
+            product_code INTEGER NOT NULL,
+            warehouse_id INTEGER NOT NULL,
+            opened_day TEXT,
+            safety_stock INTEGER,
+            last_day TEXT,
+            last_quantity INTEGER,
+            resolved_day TEXT,
+            resolved_quantity INTEGER
+        )
+    """)
+    # A pair has at most one open alert, and the open alerts are read without touching the resolved ones
+    conn.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_shortage_events_open
+        ON ShortageEvents (product_code, warehouse_id) WHERE resolved_day IS NULL
+    """)
+    # Finds the latest snapshot of a product in a warehouse when evaluating its alert
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_warehouse_stock_pair
+        ON WarehouseStock (product_code, warehouse_id, stock_day, quantity_available)
+    """)
+    refresh_shortage_events(conn)
+
+
+# Migration 8: create the histograms of delays per kind of timeliness, order day and party, filled from the existing
+# deliveries and orders. Percentiles of any range of days are computed from them without reading the raw records
+def create_delay_histogram(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS DelayHistogram (
+            kind TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            party_id INTEGER NOT NULL,
+            delay_days INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (kind, day, party_id, delay_days)
+        ) WITHOUT ROWID
+    """)
+    refresh_delay_histogram(conn)
+
+
+# Migration 9: index the stock days of the daily summary and the warehouse names, which the date pickers and
+# the warehouse filters of the pages look up
+def create_lookup_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_summary_day ON DailyWarehouseSummary (day)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_warehouses_name ON Warehouses (warehouse_name, warehouse_id)")
+    conn.execute("ANALYZE")
+
+
+# Migration 10: create the index of daily sales per product and sales channel, filled from the existing orders
+def create_product_channel_sales(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS ProductChannelSales (
+            product_code INTEGER NOT NULL,
+            sales_channel TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            PRIMARY KEY (product_code, sales_channel, day)
+        ) WITHOUT ROWID
+    """)
+    refresh_channel_sales(conn)
+
+
+# Migrations in the order they are applied; the schema version of a database is the number of applied migrations
+MIGRATIONS = [
+    create_tables,
+    add_stock_day,
+    create_indexes,
+    create_daily_summary,
+    create_product_daily_sales,
+    create_product_search,
+    create_shortage_events,
+    create_delay_histogram,
+    create_lookup_indexes,
+    create_product_channel_sales
+]
+
+
+# Function to fetch the schema version of a database
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+# Function to apply the migrations which have not been applied to a database yet
+# Each migration runs in its own transaction together with the update of the schema version
+def run_migrations(conn):
+    schema_version = get_schema_version(conn)
+    applied = []
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= schema_version:
+            continue
+        with conn:
+            conn.execute("BEGIN")
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+        applied.append(migration.__name__)
+    return applied
+
+
+# Function to fetch the query plan of a query
+def explain_query(conn, query, params=()):
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", params)]
+
+
+# Function to find the steps of a query plan which read a whole table instead of an index
+def find_full_scans(conn, query, params=()):
+    return [step for step in explain_query(conn, query, params) if step.startswith('SCAN') and 'INDEX' not in step]
@@ -0,0 +1,99 @@
+import pandas as pd
+
+from magwiz.query_builder import contains, starts_with
+from magwiz.query_cache import read_query
+
+# Shortest search text the trigram index can match; shorter texts are matched with LIKE
+MIN_TRIGRAM_LENGTH = 3
+
+# Share of the trigrams of a search text a product name must contain to be returned as a fuzzy match
+MIN_FUZZY_SIMILARITY = 0.5
+
+# Number of products returned by a search
+MAX_SEARCH_RESULTS = 20
+
+# Number of candidates ranked by bm25 which are checked for fuzzy matches, per returned product
+FUZZY_CANDIDATES_FACTOR = 10
+
+
+# Function to quote a text as a single FTS5 phrase
+def quote_phrase(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+# Function to split a text into its lowercase trigrams
+def get_trigrams(text):
+    text = text.lower()
+    return {text[index:index + MIN_TRIGRAM_LENGTH] for index in range(len(text) - MIN_TRIGRAM_LENGTH + 1)}
+
+
+# Function to build a condition matching the rows whose product name contains a text
+# The condition filters the given product code column with the full-text index instead of scanning the names
+def matches_product_name(code_column, text):
+    text = text.strip()
+    if len(text) >= MIN_TRIGRAM_LENGTH:
+        # A phrase of the trigram index matches the names containing the text, ignoring case
+        return f"{code_column} IN (SELECT rowid FROM ProductSearch WHERE ProductSearch MATCH ?)", [quote_phrase(text)]
+    name_condition, params = contains('product_name', text)
+    return f"{code_column} IN (SELECT product_code FROM Products WHERE {name_condition})", params
+
+
+# Function to find the products whose name contains a text, names starting with it first
+def search_exact(conn, text, limit):
+    if len(text) < MIN_TRIGRAM_LENGTH:
+        # Texts too short for the trigram index only match the beginning of names
+        name_condition, params = starts_with('product_name', text)
+        query = f"""
+            SELECT product_code, product_name, 0.0 AS score
+            FROM Products
+            WHERE {name_condition}
+            ORDER BY product_name
+            LIMIT ?
+        """
+        return read_query(query, conn, params=params + [limit])
+
+    query = """
+        SELECT rowid AS product_code, product_name, bm25(ProductSearch) AS score
+        FROM ProductSearch
+        WHERE ProductSearch MATCH ?
+        ORDER BY LOWER(SUBSTR(product_name, 1, ?)) = LOWER(?) DESC, score, product_name
+        LIMIT ?
+    """
+    return read_query(query, conn, params=[quote_phrase(text), len(text), text, limit])
+
+
+# Function to find the products whose name shares most trigrams with a text, which tolerates typos
+def search_fuzzy(conn, text, limit):
+    trigrams = get_trigrams(text)
+    if not trigrams:
+        return pd.DataFrame(columns=['product_code', 'product_name', 'score'])
+
+    # Candidates containing any of the trigrams, best bm25 ranks first
+    query = """
+        SELECT rowid AS product_code, product_name
+        FROM ProductSearch
+        WHERE ProductSearch MATCH ?
+        ORDER BY bm25(ProductSearch)
+        LIMIT ?
+    """
+    match_text = ' OR '.join(quote_phrase(trigram) for trigram in sorted(trigrams))
+    candidates = read_query(query, conn, params=[match_text, limit * FUZZY_CANDIDATES_FACTOR])
+
+    candidates['score'] = [len(trigrams & get_trigrams(name)) / len(trigrams) for name in candidates['product_name']]
+    candidates = candidates[candidates['score'] >= MIN_FUZZY_SIMILARITY]
+    return candidates.sort_values(['score', 'product_name'], ascending=[False, True]).head(limit)
+
+
+# Function to search products by name, for search boxes and suggestions
+# Exact matches come first, followed by fuzzy matches when there are fewer exact matches than the limit
+def search_products(conn, text, limit=MAX_SEARCH_RESULTS):
+    text = text.strip()
+    if not text:
+        return pd.DataFrame(columns=['product_code', 'product_name', 'match'])
+
+    results = search_exact(conn, text, limit).assign(match='exact')
+    if len(results) < limit and len(text) > MIN_TRIGRAM_LENGTH:
+        fuzzy_results = search_fuzzy(conn, text, limit)
+        fuzzy_results = fuzzy_results[~fuzzy_results['product_code'].isin(results['product_code'])]
+        results = pd.concat([results, fuzzy_results.assign(match='fuzzy')], ignore_index=True).head(limit)
+    return results[['product_code', 'product_name', 'match']]
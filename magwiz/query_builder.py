@@ -0,0 +1,70 @@
+import datetime
+import json
+
+# Comparison operators accepted by compare()
+COMPARISON_OPERATORS = ['=', '<>', '!=', '<', '<=', '>', '>=']
+
+# Character escaping the wildcards of LIKE patterns
+LIKE_ESCAPE = '\\'
+
+
+# Function to convert a filter value into a value SQLite can bind
+def to_parameter(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if hasattr(value, 'item'):
+        # Convert numpy scalars to plain Python values
+        return value.item()
+    if value is not None and not isinstance(value, (str, int, float, bytes)):
+        raise TypeError(f"Unsupported filter value: {value!r}")
+    return value
+
+
+# Function to build a condition comparing a column with a value
+def compare(column, operator, value):
+    if operator not in COMPARISON_OPERATORS:
+        raise ValueError(f"Unsupported comparison operator: {operator}")
+    return f"{column} {operator} ?", [to_parameter(value)]
+
+
+# Function to build a condition matching a column against a list of values
+# The values are bound as one JSON array, so the SQL text is the same whatever the number of values
+def in_values(column, values):
+    return f"{column} IN (SELECT value FROM json_each(?))", [json.dumps([to_parameter(value) for value in values])]
+
+
+# Function to escape the wildcards of a text used in a LIKE pattern
+def escape_like(text):
+    return text.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace('%', f"{LIKE_ESCAPE}%").replace('_', f"{LIKE_ESCAPE}_")
+
+
+# Function to build a condition matching the rows whose column contains a text
+def contains(column, text):
+    return f"{column} LIKE ? ESCAPE '{LIKE_ESCAPE}'", [f"%{escape_like(text)}%"]
+
+
+# Function to build a condition matching the rows whose column starts with a text
+def starts_with(column, text):
+    return f"{column} LIKE ? ESCAPE '{LIKE_ESCAPE}'", [f"{escape_like(text)}%"]
+
+
+# Function to build a condition matching the rows whose column has a value
+def is_not_null(column):
+    return f"{column} IS NOT NULL", []
+
+
+# Function to combine conditions with AND
+# Conditions set to None are left out, so optional filters can be passed as they are
+def combine_conditions(conditions):
+    conditions = [condition for condition in conditions if condition is not None]
+    sql = ' AND '.join(condition_sql for condition_sql, condition_params in conditions)
+    params = [param for condition_sql, condition_params in conditions for param in condition_params]
+    return sql, params
+
+
+# Function to combine conditions into a WHERE clause with its parameters (empty without conditions)
+def build_where(conditions):
+    sql, params = combine_conditions(conditions)
+    return (f"WHERE {sql}" if sql else ''), params
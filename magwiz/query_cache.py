@@ -0,0 +1,81 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+# Memory budget of the cached query results, shared by all sessions of the app
+MAX_CACHE_BYTES = 256 * 1024 * 1024
+
+# Cached results in least recently used order, keyed by SQL text and parameters
+_cache = OrderedDict()
+_cache_state = {'bytes': 0, 'data_version': None}
+_cache_lock = threading.Lock()
+
+
+# Function to create the table holding the data version counter
+def ensure_data_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS DataVersion (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    conn.execute("INSERT OR IGNORE INTO DataVersion (id, version) VALUES (1, 0)")
+    conn.commit()
+
+
+# Function to fetch the data version, which changes every time an import changes data
+def get_data_version(conn):
+    try:
+        row = conn.execute("SELECT version FROM DataVersion WHERE id = 1").fetchone()
+    except sqlite3.OperationalError:
+        # Databases which were never updated from the app have no version table yet
+        return 0
+    return row[0] if row else 0
+
+
+# Function to increase the data version (part of the caller's transaction)
+def bump_data_version(conn):
+    conn.execute("UPDATE DataVersion SET version = version + 1 WHERE id = 1")
+
+
+# Function to drop all cached results
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+        _cache_state['bytes'] = 0
+
+
+# Function to run a query through the shared result cache
+# Results stay cached until an import changes the data version or they are evicted to stay within the memory budget
+def read_query(sql, conn, params=None):
+    key = (sql, tuple(params) if params is not None else None)
+    data_version = get_data_version(conn)
+
+    with _cache_lock:
+        if _cache_state['data_version'] != data_version:
+            # The data changed, so every cached result is stale
+            _cache.clear()
+            _cache_state['bytes'] = 0
+            _cache_state['data_version'] = data_version
+        elif key in _cache:
+            _cache.move_to_end(key)
+            # Pages modify the frames they get, so each one receives its own copy
+            return _cache[key][0].copy()
+
+    df = pd.read_sql_query(sql, conn, params=params)
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    if size > MAX_CACHE_BYTES:
+        return df
+
+    with _cache_lock:
+        # Another session may have cached the same result or bumped the version in the meantime
+        if _cache_state['data_version'] == data_version and key not in _cache:
+            _cache[key] = (df, size)
+            _cache_state['bytes'] += size
+            while _cache_state['bytes'] > MAX_CACHE_BYTES:
+                evicted_df, evicted_size = _cache.popitem(last=False)[1]
+                _cache_state['bytes'] -= evicted_size
+
+    return df.copy()
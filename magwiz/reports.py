@@ -0,0 +1,107 @@
+from magwiz.abc_analysis import (DEFAULT_THRESHOLDS, DEFAULT_XYZ_THRESHOLDS, classify_products, format_abc_report,
+                                 get_order_date_range)
+from magwiz.fill_levels import load_fill_levels
+from magwiz.forecasting import (DEFAULT_DEMAND_WINDOW_DAYS, DEFAULT_HORIZON_DAYS, DEFAULT_SERVICE_LEVEL,
+                                find_projected_shortages, format_forecast_report, get_forecast)
+from magwiz.lead_time import load_lead_time_records
+from magwiz.shortage_alerts import load_open_shortages
+from magwiz.shortages import get_stock_dates, load_shortages
+from magwiz.timeliness import get_timeliness_date_range, load_timeliness_records
+from magwiz.warehouse_stock import load_inventory_status
+
+
+# Function to select the stock dates of a report, the latest snapshot when no dates are given
+def get_report_dates(conn, settings):
+    if settings.get('dates'):
+        return settings['dates']
+    dates = get_stock_dates(conn)
+    return dates[-1:]
+
+
+# Function to select the period of a report, the whole range of dates when no dates are given
+def get_report_period(settings, min_date, max_date):
+    return settings.get('start_date') or min_date, settings.get('end_date') or max_date
+
+
+# Function to build the inventory status report of the warehouse stock page
+def build_inventory_status(conn, settings):
+    return load_inventory_status(conn, get_report_dates(conn, settings), settings.get('warehouses'), settings.get('product_name'))
+
+
+# Function to build the shortages report of the stock shortages page
+def build_inventory_shortages(conn, settings):
+    shortages = load_shortages(conn, get_report_dates(conn, settings), settings.get('warehouses'), settings.get('product_name'))
+    return shortages.drop(columns=['Total Available', 'Total Missing'])
+
+
+# Function to build the open shortage alerts report of the stock shortages page
+def build_open_shortages(conn, settings):
+    return load_open_shortages(conn)
+
+
+# Function to build the ABC/XYZ classification report of the ABC analysis page
+def build_abc_analysis(conn, settings):
+    start_date, end_date = get_report_period(settings, *get_order_date_range(conn))
+    if start_date is None:
+        raise ValueError("There are no orders to analyze.")
+    products_df, channels = classify_products(
+        conn, start_date, end_date, settings.get('weighting') or 'quantity',
+        settings.get('thresholds') or DEFAULT_THRESHOLDS, settings.get('xyz_thresholds') or DEFAULT_XYZ_THRESHOLDS
+    )
+    return format_abc_report(products_df)
+
+
+# Function to create the builder of the timeliness report of deliveries or shipments of the order timeliness page
+def create_timeliness_builder(kind):
+    def build_timeliness(conn, settings):
+        start_date, end_date = get_report_period(settings, *get_timeliness_date_range(conn, kind))
+        if start_date is None:
+            raise ValueError("There are no orders to report.")
+        return load_timeliness_records(conn, kind, start_date, end_date)
+    return build_timeliness
+
+
+# Function to create the builder of the lead time report of deliveries or shipments of the order fulfillment time page
+def create_lead_time_builder(kind):
+    def build_lead_time(conn, settings):
+        start_date, end_date = get_report_period(settings, *get_timeliness_date_range(conn, kind))
+        if start_date is None:
+            raise ValueError("There are no orders to report.")
+        return load_lead_time_records(conn, kind, start_date, end_date)
+    return build_lead_time
+
+
+# Function to build the fill level history report of the warehouse fill levels page, one column per warehouse
+def build_fill_levels(conn, settings):
+    return load_fill_levels(conn, settings.get('warehouses')).reset_index()
+
+
+# Function to build the projected shortages report of the reorder forecast page
+def build_reorder_forecast(conn, settings):
+    as_of_date, forecast = get_forecast(
+        conn, settings.get('window_days') or DEFAULT_DEMAND_WINDOW_DAYS, settings.get('service_level') or DEFAULT_SERVICE_LEVEL
+    )
+    if as_of_date is None:
+        raise ValueError("There are no stock snapshots to forecast from.")
+    return format_forecast_report(find_projected_shortages(forecast, settings.get('horizon_days') or DEFAULT_HORIZON_DAYS))
+
+
+# Reports which can be generated outside the app, with the page showing them and their default file name
+REPORTS = {
+    'inventory_status': {'page': "Warehouse Stock", 'build': build_inventory_status, 'file_stem': "inventory_status"},
+    'inventory_shortages': {'page': "Stock Shortages", 'build': build_inventory_shortages, 'file_stem': "inventory_shortages"},
+    'open_shortages': {'page': "Stock Shortages", 'build': build_open_shortages, 'file_stem': "open_shortages"},
+    'abc_analysis': {'page': "ABC Analysis", 'build': build_abc_analysis, 'file_stem': "abc_analysis"},
+    'supplier_timeliness': {'page': "Order Timeliness", 'build': create_timeliness_builder('delivery'), 'file_stem': "supplier_timeliness"},
+    'customer_timeliness': {'page': "Order Timeliness", 'build': create_timeliness_builder('shipping'), 'file_stem': "customer_timeliness"},
+    'delivery_lead_time': {'page': "Order Fulfillment Time", 'build': create_lead_time_builder('delivery'), 'file_stem': "delivery_lead_time"},
+    'shipping_lead_time': {'page': "Order Fulfillment Time", 'build': create_lead_time_builder('shipping'), 'file_stem': "shipping_lead_time"},
+    'fill_levels': {'page': "Warehouse Fill Levels", 'build': build_fill_levels, 'file_stem': "fill_levels"},
+    'reorder_forecast': {'page': "Reorder Forecast", 'build': build_reorder_forecast, 'file_stem': "reorder_forecast"}
+}
+
+
+# Function to build a report from its name and settings
+# Settings which do not apply to the report are ignored, and missing settings take the defaults of its page
+def build_report(conn, report_name, settings=None):
+    return REPORTS[report_name]['build'](conn, settings or {})
@@ -0,0 +1,192 @@
+import datetime
+import threading
+
+import numpy as np
+import pandas as pd
+
+from magwiz.query_cache import get_data_version
+
+# First day of the day numbers stored in the sales index
+EPOCH = datetime.date(1970, 1, 1)
+
+# Query finding the products of the rows affected by a table sync, for each table feeding the sales index
+SALES_PRODUCT_QUERIES = {
+    'Orders': "SELECT od.product_code FROM main.OrderDetails od WHERE od.order_id IN ({keys})",
+    'OrderDetails': "SELECT product_code FROM main.OrderDetails WHERE order_product_id IN ({keys})"
+}
+
+# Query computing the daily sales and their running total per product
+# Days are stored as the number of days since EPOCH, which keeps the index compact
+SALES_QUERY = """
+    SELECT
+        od.product_code,
+        CAST(julianday(DATE(o.order_date)) - julianday('1970-01-01') AS INTEGER) AS day,
+        COALESCE(SUM(od.quantity), 0) AS quantity,
+        SUM(COALESCE(SUM(od.quantity), 0)) OVER (PARTITION BY od.product_code ORDER BY DATE(o.order_date)) AS cum_quantity
+    FROM main.OrderDetails od
+    JOIN main.Orders o ON od.order_id = o.order_id
+    WHERE o.order_date IS NOT NULL AND od.product_code IS NOT NULL AND {where_clause}
+    GROUP BY od.product_code, DATE(o.order_date)
+"""
+
+# Query computing the daily sales per product and sales channel
+CHANNEL_SALES_QUERY = """
+    SELECT
+        od.product_code,
+        COALESCE(o.sales_channel, 'Unknown') AS sales_channel,
+        CAST(julianday(DATE(o.order_date)) - julianday('1970-01-01') AS INTEGER) AS day,
+        COALESCE(SUM(od.quantity), 0) AS quantity
+    FROM main.OrderDetails od
+    JOIN main.Orders o ON od.order_id = o.order_id
+    WHERE o.order_date IS NOT NULL AND od.product_code IS NOT NULL AND {where_clause}
+    GROUP BY od.product_code, COALESCE(o.sales_channel, 'Unknown'), DATE(o.order_date)
+"""
+
+# Sales index loaded into memory, reloaded when the data version changes
+_index_cache = {'data_version': None, 'index': None}
+_index_lock = threading.Lock()
+
+# Channel sales index loaded into memory, reloaded when the data version changes
+_channel_index_cache = {'data_version': None, 'index': None}
+
+
+# Function to rebuild the whole sales index from the order lines
+def refresh_product_sales(conn):
+    conn.execute("DELETE FROM main.ProductDailySales")
+    conn.execute(f"INSERT INTO main.ProductDailySales {SALES_QUERY.format(where_clause='1')}")
+
+
+# Function to rebuild the whole channel sales index from the order lines
+def refresh_channel_sales(conn):
+    conn.execute("DELETE FROM main.ProductChannelSales")
+    conn.execute(f"INSERT INTO main.ProductChannelSales {CHANNEL_SALES_QUERY.format(where_clause='1')}")
+
+
+# Function to rebuild the sales index and the channel sales index of the products listed in the temp.sales_products table
+def refresh_sales_products(conn):
+    where_clause = 'od.product_code IN (SELECT product_code FROM temp.sales_products)'
+    conn.execute("DELETE FROM main.ProductDailySales WHERE product_code IN (SELECT product_code FROM temp.sales_products)")
+    conn.execute(f"INSERT INTO main.ProductDailySales {SALES_QUERY.format(where_clause=where_clause)}")
+    conn.execute("DELETE FROM main.ProductChannelSales WHERE product_code IN (SELECT product_code FROM temp.sales_products)")
+    conn.execute(f"INSERT INTO main.ProductChannelSales {CHANNEL_SALES_QUERY.format(where_clause=where_clause)}")
+
+
+# Function to remember the products whose sales are affected by a table sync
+# Runs before the changes are applied to find the old products, and again afterwards to find the new ones
+def collect_sales_products(conn, table_name):
+    keys = "SELECT row_key FROM temp.sync_deleted UNION ALL SELECT row_key FROM temp.sync_changed"
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS sales_products (product_code INTEGER PRIMARY KEY)")
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.sales_products (product_code)
+        SELECT product_code FROM ({SALES_PRODUCT_QUERIES[table_name].format(keys=keys)})
+        WHERE product_code IS NOT NULL
+    """)
+
+
+# Function to bring the sales index of the products affected by a table sync up to date
+def update_sales_products(conn, table_name):
+    collect_sales_products(conn, table_name)
+    try:
+        refresh_sales_products(conn)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.sales_products")
+
+
+# Function to convert a date into a day number of the sales index
+def to_day_number(date):
+    return (date - EPOCH).days
+
+
+# Function to load the sales index into NumPy arrays, sorted by product and day
+def load_sales_index(conn):
+    data_version = get_data_version(conn)
+    with _index_lock:
+        if _index_cache['data_version'] == data_version:
+            return _index_cache['index']
+
+    rows = conn.execute("SELECT product_code, day, cum_quantity FROM ProductDailySales ORDER BY product_code, day").fetchall()
+    if rows:
+        product_codes, days, cum_quantities = (np.array(column) for column in zip(*rows))
+    else:
+        product_codes, days, cum_quantities = np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([])
+
+    # The rows of each product form one segment of the arrays
+    products, segment_starts = np.unique(product_codes, return_index=True)
+    product_indexes = np.repeat(np.arange(len(products)), np.diff(np.append(segment_starts, len(product_codes))))
+    # Product and day are combined into one sorted key, so a single searchsorted finds a day within every segment
+    day_span = int(days.max() - days.min() + 2) if len(days) else 1
+    day_offset = int(days.min()) - 1 if len(days) else 0
+    index = {
+        'products': products,
+        'segment_starts': segment_starts,
+        'keys': product_indexes.astype(np.int64) * day_span + (days - day_offset),
+        'cum_quantities': cum_quantities.astype(float),
+        'day_span': day_span,
+        'day_offset': day_offset
+    }
+
+    with _index_lock:
+        _index_cache['data_version'] = data_version
+        _index_cache['index'] = index
+    return index
+
+
+# Function to find, for every product, the running total of its sales up to a day number (included)
+def get_cumulative_sales(index, day):
+    # Days outside the indexed period are clamped to one day before or after it
+    day = min(max(day - index['day_offset'], 0), index['day_span'] - 1)
+    product_indexes = np.arange(len(index['products']), dtype=np.int64)
+    positions = np.searchsorted(index['keys'], product_indexes * index['day_span'] + day, side='right') - 1
+    # A position before the segment of a product means it had no sales up to that day
+    has_sales = positions >= index['segment_starts']
+    return np.where(has_sales, index['cum_quantities'][np.maximum(positions, 0)], 0.0)
+
+
+# Function to compute the total sales of every product between two dates (both included)
+# Each total is the difference of two running totals, so the cost depends on the number of products only
+def get_sales_totals(conn, start_date, end_date):
+    index = load_sales_index(conn)
+    totals = get_cumulative_sales(index, to_day_number(end_date)) - get_cumulative_sales(index, to_day_number(start_date) - 1)
+    return pd.DataFrame({'product_code': index['products'], 'total_sales': totals})
+
+
+# Function to load the channel sales index into NumPy arrays, sorted by day
+def load_channel_sales_index(conn):
+    data_version = get_data_version(conn)
+    with _index_lock:
+        if _channel_index_cache['data_version'] == data_version:
+            return _channel_index_cache['index']
+
+    rows = conn.execute("SELECT day, product_code, sales_channel, quantity FROM ProductChannelSales ORDER BY day").fetchall()
+    if rows:
+        days, product_codes, sales_channels, quantities = zip(*rows)
+    else:
+        days, product_codes, sales_channels, quantities = (), (), (), ()
+    # Channels are stored once, and each row refers to its channel by position
+    channel_codes, channels = pd.factorize(pd.Series(sales_channels, dtype=object), sort=True)
+    index = {
+        'days': np.array(days, dtype=np.int64),
+        'product_codes': np.array(product_codes, dtype=np.int64),
+        'channel_codes': channel_codes,
+        'quantities': np.array(quantities, dtype=float),
+        'channels': list(channels)
+    }
+
+    with _index_lock:
+        _channel_index_cache['data_version'] = data_version
+        _channel_index_cache['index'] = index
+    return index
+
+
+# Function to fetch the daily sales of every product and sales channel between two dates (both included)
+# The rows of the period are one slice of the index, so no order lines are read
+def get_channel_sales(conn, start_date, end_date):
+    index = load_channel_sales_index(conn)
+    start = np.searchsorted(index['days'], to_day_number(start_date), side='left')
+    end = np.searchsorted(index['days'], to_day_number(end_date), side='right')
+    return pd.DataFrame({
+        'product_code': index['product_codes'][start:end],
+        'sales_channel': pd.Categorical.from_codes(index['channel_codes'][start:end], index['channels']),
+        'day': index['days'][start:end],
+        'quantity': index['quantities'][start:end]
+    })
@@ -0,0 +1,143 @@
+from magwiz.query_cache import read_query
+
+# Query finding the (product, warehouse) pairs of the rows affected by a table sync, for each table feeding the alerts
+SHORTAGE_PAIR_QUERIES = {
+    'WarehouseStock': "SELECT product_code, warehouse_id FROM main.WarehouseStock WHERE stock_id IN ({keys})",
+    'Products': "SELECT product_code, warehouse_id FROM main.WarehouseStock WHERE product_code IN ({keys})"
+}
+
+
+# Function to evaluate the shortage alerts of the (product, warehouse) pairs listed in the temp.shortage_pairs table
+# The latest snapshot of each pair decides whether its alert is open: an alert is opened when the available
+# quantity drops below the safety stock and resolved once a later snapshot is back at the safety stock
+def evaluate_shortage_pairs(conn):
+    conn.execute("DROP TABLE IF EXISTS temp.shortage_latest")
+    conn.execute("""
+        CREATE TEMP TABLE shortage_latest AS
+        SELECT sp.product_code, sp.warehouse_id, ws.stock_day, ws.quantity_available, p.safety_stock
+        FROM temp.shortage_pairs sp
+        JOIN main.WarehouseStock ws ON ws.stock_id = (
+            SELECT stock_id FROM main.WarehouseStock
+            WHERE product_code = sp.product_code AND warehouse_id = sp.warehouse_id
+            ORDER BY stock_day DESC, stock_id DESC
+            LIMIT 1
+        )
+        LEFT JOIN main.Products p ON p.product_code = sp.product_code
+    """)
+    try:
+        # Resolve the open alerts of pairs which are back at their safety stock, or lost their snapshots or product
+        num_resolved = conn.execute("""
+            UPDATE main.ShortageEvents
+            SET resolved_day = COALESCE(l.stock_day, ShortageEvents.last_day),
+                resolved_quantity = l.quantity_available
+            FROM temp.shortage_pairs sp
+            LEFT JOIN temp.shortage_latest l ON l.product_code = sp.product_code AND l.warehouse_id = sp.warehouse_id
+            WHERE ShortageEvents.resolved_day IS NULL
+              AND ShortageEvents.product_code = sp.product_code AND ShortageEvents.warehouse_id = sp.warehouse_id
+              AND NOT COALESCE(l.quantity_available < l.safety_stock, 0)
+        """).rowcount
+
+        # Follow the latest snapshot of the alerts which stay open
+        conn.execute("""
+            UPDATE main.ShortageEvents
+            SET last_day = l.stock_day, last_quantity = l.quantity_available, safety_stock = l.safety_stock
+            FROM temp.shortage_latest l
+            WHERE ShortageEvents.resolved_day IS NULL
+              AND ShortageEvents.product_code = l.product_code AND ShortageEvents.warehouse_id = l.warehouse_id
+        """)
+
+        # Open alerts for new shortages, starting on the first day of the current run of snapshots below the safety stock
+        num_opened = conn.execute("""
+            INSERT INTO main.ShortageEvents
+                (product_code, warehouse_id, opened_day, safety_stock, last_day, last_quantity)
+            SELECT
+                l.product_code,
+                l.warehouse_id,
+                (SELECT MIN(ws.stock_day) FROM main.WarehouseStock ws
+                 WHERE ws.product_code = l.product_code AND ws.warehouse_id = l.warehouse_id
+                   AND ws.stock_day > COALESCE((
+                       SELECT MAX(r.stock_day) FROM main.WarehouseStock r
+                       WHERE r.product_code = l.product_code AND r.warehouse_id = l.warehouse_id
+                         AND r.quantity_available >= l.safety_stock
+                   ), '')),
+                l.safety_stock,
+                l.stock_day,
+                l.quantity_available
+            FROM temp.shortage_latest l
+            WHERE l.quantity_available < l.safety_stock
+              AND NOT EXISTS (
+                  SELECT 1 FROM main.ShortageEvents e
+                  WHERE e.resolved_day IS NULL AND e.product_code = l.product_code AND e.warehouse_id = l.warehouse_id
+              )
+        """).rowcount
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.shortage_latest")
+
+    return num_opened, num_resolved
+
+
+# Function to evaluate the shortage alerts of all (product, warehouse) pairs
+def refresh_shortage_events(conn):
+    conn.execute("DROP TABLE IF EXISTS temp.shortage_pairs")
+    conn.execute("""
+        CREATE TEMP TABLE shortage_pairs AS
+        SELECT DISTINCT product_code, warehouse_id FROM main.WarehouseStock
+        WHERE product_code IS NOT NULL AND warehouse_id IS NOT NULL
+    """)
+    try:
+        return evaluate_shortage_pairs(conn)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.shortage_pairs")
+
+
+# Function to remember the (product, warehouse) pairs affected by a table sync
+# Runs before the changes are applied to find the old pairs, and again afterwards to find the new ones
+def collect_shortage_pairs(conn, table_name):
+    keys = "SELECT row_key FROM temp.sync_deleted UNION ALL SELECT row_key FROM temp.sync_changed"
+    conn.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS shortage_pairs (
+            product_code INTEGER NOT NULL,
+            warehouse_id INTEGER NOT NULL,
+            PRIMARY KEY (product_code, warehouse_id)
+        )
+    """)
+    conn.execute(f"""
+        INSERT OR IGNORE INTO temp.shortage_pairs (product_code, warehouse_id)
+        SELECT product_code, warehouse_id FROM ({SHORTAGE_PAIR_QUERIES[table_name].format(keys=keys)})
+        WHERE product_code IS NOT NULL AND warehouse_id IS NOT NULL
+    """)
+
+
+# Function to evaluate the shortage alerts of the pairs affected by a table sync
+def update_shortage_pairs(conn, table_name):
+    collect_shortage_pairs(conn, table_name)
+    try:
+        evaluate_shortage_pairs(conn)
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.shortage_pairs")
+
+
+# Function to load the open shortage alerts, largest missing quantity first
+# Open alerts are read through a partial index, so the query never touches the stock history
+def load_open_shortages(conn):
+    query = """
+        SELECT
+            p.product_name AS 'Product Name',
+            w.warehouse_name AS 'Warehouse',
+            e.opened_day AS 'Short Since',
+            e.last_day AS 'Last Stock Date',
+            e.last_quantity AS 'Quantity Available',
+            e.safety_stock AS 'Safety Stock',
+            e.safety_stock - e.last_quantity AS 'Missing Quantity'
+        FROM ShortageEvents e
+        LEFT JOIN Products p ON e.product_code = p.product_code
+        LEFT JOIN Warehouses w ON e.warehouse_id = w.warehouse_id
+        WHERE e.resolved_day IS NULL
+        ORDER BY e.safety_stock - e.last_quantity DESC, p.product_name
+    """
+    return read_query(query, conn)
+
+
+# Function to count all alerts and the resolved ones, to report the alerts opened and resolved by an import
+def count_shortage_events(conn):
+    return conn.execute("SELECT COUNT(*), COUNT(resolved_day) FROM ShortageEvents").fetchone()
@@ -0,0 +1,43 @@
+from magwiz.product_search import matches_product_name
+from magwiz.query_builder import combine_conditions, in_values
+from magwiz.query_cache import read_query
+
+
+# Function to fetch the days with stock snapshots
+def get_stock_dates(conn):
+    return read_query("SELECT DISTINCT day FROM DailyWarehouseSummary ORDER BY day", conn)['day'].tolist()
+
+
+# Function to load the products below their safety stock per date and warehouse, for the requested dates only
+# Every row also carries the totals of its date (available quantity and missing quantity of all shortages
+# matching the filters), computed by window functions in the same query
+def load_shortages(conn, dates, warehouses=None, product_name=None):
+    conditions, params = combine_conditions([
+        in_values('ws.stock_day', dates),
+        in_values('w.warehouse_name', warehouses) if warehouses else None,
+        matches_product_name('ws.product_code', product_name) if product_name else None
+    ])
+    query = f"""
+        SELECT
+            ws.stock_day AS 'Stock Date',
+            w.warehouse_name AS 'Warehouse',
+            p.product_name AS 'Product Name',
+            ws.quantity_available AS 'Quantity Available',
+            p.safety_stock AS 'Safety Stock',
+            p.safety_stock - ws.quantity_available AS 'Missing Quantity',
+            SUM(ws.quantity_available) OVER (PARTITION BY ws.stock_day) AS 'Total Available',
+            SUM(p.safety_stock - ws.quantity_available) OVER (PARTITION BY ws.stock_day) AS 'Total Missing'
+        FROM WarehouseStock ws
+        JOIN Products p ON ws.product_code = p.product_code
+        LEFT JOIN Warehouses w ON ws.warehouse_id = w.warehouse_id
+        WHERE ws.quantity_available < p.safety_stock AND {conditions}
+        ORDER BY ws.stock_day, p.product_name, w.warehouse_name
+    """
+    return read_query(query, conn, params=params)
+
+
+# Function to fetch the totals of each requested date from the loaded shortages
+# Dates without shortages get zero totals
+def summarize_shortages(shortages_df, dates):
+    totals = shortages_df.drop_duplicates('Stock Date').set_index('Stock Date')[['Total Available', 'Total Missing']]
+    return totals.reindex(sorted(dates), fill_value=0)
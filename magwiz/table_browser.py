@@ -0,0 +1,133 @@
+import sqlite3
+
+from magwiz.query_builder import combine_conditions, compare, contains
+from magwiz.query_cache import read_query
+
+# Number of rows displayed on one page of the table browser
+PAGE_SIZE = 100
+
+# Number of matching rows counted at most when filters are applied
+MAX_COUNTED_ROWS = 10000
+
+# Comparison operators which can start a column filter, longest first
+FILTER_OPERATORS = ['>=', '<=', '<>', '!=', '>', '<', '=']
+
+
+# Function to fetch the column names of a table (the first column is the primary key)
+def get_browser_columns(conn, table_name):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")]
+
+
+# Function to convert the text typed into a filter into a number when possible
+def parse_filter_value(text):
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+# Function to turn the column filters into a WHERE condition with bound parameters
+# A filter starting with a comparison operator compares the column with the value, any other text
+# matches the rows whose column contains it
+def build_filter_condition(filters):
+    conditions = []
+    for column, text in filters.items():
+        text = text.strip()
+        if not text:
+            continue
+        operator = next((operator for operator in FILTER_OPERATORS if text.startswith(operator)), None)
+        if operator:
+            conditions.append(compare(column, operator, parse_filter_value(text[len(operator):].strip())))
+        else:
+            conditions.append(contains(column, text))
+    return combine_conditions(conditions)
+
+
+# Function to build the condition selecting the rows which come after a cursor in the sort order
+# NULL values are sorted first in ascending order and last in descending order, like SQLite does
+def build_cursor_condition(sort_column, key, descending, cursor):
+    sort_value, key_value = cursor
+    comparison = '<' if descending else '>'
+    if sort_column == key:
+        return f"{key} {comparison} ?", [key_value]
+    if sort_value is None:
+        condition = f"({sort_column} IS NULL AND {key} {comparison} ?)"
+        if not descending:
+            condition = f"({condition} OR {sort_column} IS NOT NULL)"
+        return condition, [key_value]
+    condition = f"({sort_column} {comparison} ? OR ({sort_column} = ? AND {key} {comparison} ?)"
+    if descending:
+        condition += f" OR {sort_column} IS NULL"
+    return condition + ")", [sort_value, sort_value, key_value]
+
+
+# Function to convert a value of a DataFrame into a parameter SQLite accepts
+def to_cursor_value(value):
+    if value is None or value != value:
+        return None
+    if hasattr(value, 'item'):
+        # Convert numpy scalars to plain Python values
+        return value.item()
+    return value
+
+
+# Function to fetch one page of a table, starting after the given cursor
+# Pages are read with keyset pagination, so each page costs the same regardless of its position in the table.
+# Returns the rows of the page and the cursor of the next page (None on the last page)
+def fetch_page(conn, table_name, sort_column, descending=False, filters=None, cursor=None, page_size=PAGE_SIZE):
+    columns = get_browser_columns(conn, table_name)
+    key = columns[0]
+
+    conditions = []
+    params = []
+    filter_condition, filter_params = build_filter_condition(filters or {})
+    if filter_condition:
+        conditions.append(filter_condition)
+        params += filter_params
+    if cursor is not None:
+        cursor_condition, cursor_params = build_cursor_condition(sort_column, key, descending, cursor)
+        conditions.append(cursor_condition)
+        params += cursor_params
+
+    direction = 'DESC' if descending else 'ASC'
+    order_by = f"{key} {direction}" if sort_column == key else f"{sort_column} {direction}, {key} {direction}"
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    # One row more than the page size tells whether there is a next page
+    query = f"""
+        SELECT {', '.join(columns)} FROM {table_name}
+        {where_clause}
+        ORDER BY {order_by}
+        LIMIT {page_size + 1}
+    """
+    df = read_query(query, conn, params=params)
+
+    next_cursor = None
+    if len(df) > page_size:
+        df = df.iloc[:page_size]
+        last_row = df.iloc[-1]
+        next_cursor = (to_cursor_value(last_row[sort_column]), to_cursor_value(last_row[key]))
+    return df, next_cursor
+
+
+# Function to estimate the number of rows of a table from the statistics of the query planner
+def estimate_row_count(conn, table_name):
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table_name,)).fetchone()
+    except sqlite3.OperationalError:
+        # The database has never been analyzed
+        row = None
+    if row:
+        return int(row[0].split()[0])
+    # The largest key is read from the end of the primary key index
+    return conn.execute(f"SELECT COALESCE(MAX(rowid), 0) FROM {table_name}").fetchone()[0]
+
+
+# Function to count the rows matching the column filters, stopping at MAX_COUNTED_ROWS
+def count_filtered_rows(conn, table_name, filters):
+    filter_condition, params = build_filter_condition(filters)
+    if not filter_condition:
+        return estimate_row_count(conn, table_name)
+    query = f"SELECT COUNT(*) FROM (SELECT 1 FROM {table_name} WHERE {filter_condition} LIMIT {MAX_COUNTED_ROWS + 1})"
+    return conn.execute(query, params).fetchone()[0]
@@ -0,0 +1,100 @@
+import datetime
+
+import pandas as pd
+
+from magwiz.query_cache import read_query
+
+# Statuses of completed deliveries and shipments
+ON_TIME_STATUS = 'Completed on time'
+LATE_STATUS = 'Completed with a delay'
+
+# Tables and labels of the two kinds of timeliness: deliveries from suppliers and shipments to customers
+TIMELINESS_KINDS = {
+    'delivery': {
+        'table': 'Deliveries',
+        'id_column': 'delivery_id',
+        'party_table': 'Suppliers',
+        'party_id_column': 'supplier_id',
+        'party_name_column': 'supplier_name',
+        'expected_column': 'expected_delivery_date',
+        'actual_column': 'delivery_date',
+        'status_column': 'delivery_status',
+        'number_label': 'Delivery Number',
+        'party_label': 'Supplier Name',
+        'expected_label': 'Expected Delivery Date',
+        'actual_label': 'Delivery Date',
+        'status_label': 'Delivery Status'
+    },
+    'shipping': {
+        'table': 'Orders',
+        'id_column': 'order_id',
+        'party_table': 'Customers',
+        'party_id_column': 'customer_id',
+        'party_name_column': 'customer_name',
+        'expected_column': 'expected_shipping_date',
+        'actual_column': 'shipping_date',
+        'status_column': 'shipping_status',
+        'number_label': 'Order Number',
+        'party_label': 'Customer Name',
+        'expected_label': 'Expected Shipping Date',
+        'actual_label': 'Shipping Date',
+        'status_label': 'Shipping Status'
+    }
+}
+
+
+# Function to fetch the dates of the first and the last order of a kind
+# MIN and MAX are read in separate subqueries, so each is a single lookup in the order date index
+def get_timeliness_date_range(conn, kind):
+    table = TIMELINESS_KINDS[kind]['table']
+    query = f"SELECT DATE((SELECT MIN(order_date) FROM {table})) AS first_date, DATE((SELECT MAX(order_date) FROM {table})) AS last_date"
+    row = read_query(query, conn).iloc[0]
+    if row['first_date'] is None:
+        return None, None
+    return datetime.date.fromisoformat(row['first_date']), datetime.date.fromisoformat(row['last_date'])
+
+
+# Function to load the deliveries or shipments ordered between two dates (both included)
+# The dates are compared with the stored order dates, so the rows are read with a range scan of the order date index
+def load_timeliness_records(conn, kind, start_date, end_date):
+    settings = TIMELINESS_KINDS[kind]
+    query = f"""
+        SELECT
+            t.{settings['id_column']} AS '{settings['number_label']}',
+            p.{settings['party_name_column']} AS '{settings['party_label']}',
+            DATE(t.order_date) AS 'Order Date',
+            DATE(t.{settings['expected_column']}) AS '{settings['expected_label']}',
+            DATE(t.{settings['actual_column']}) AS '{settings['actual_label']}',
+            t.{settings['status_column']} AS '{settings['status_label']}'
+        FROM {settings['table']} t
+        JOIN {settings['party_table']} p ON t.{settings['party_id_column']} = p.{settings['party_id_column']}
+        WHERE t.order_date >= ? AND t.order_date < ?
+    """
+    params = [start_date.isoformat(), (end_date + datetime.timedelta(days=1)).isoformat()]
+    return read_query(query, conn, params=params)
+
+
+# Function to compute the timeliness metrics of loaded deliveries or shipments in one pass
+# Returns the number of records per status, the share of records completed on time and the parties
+# with the most records completed on time (best) and with a delay (worst), with their number of records
+def compute_timeliness_metrics(records_df, kind):
+    settings = TIMELINESS_KINDS[kind]
+    # Number of records of each party per status, parties in alphabetical order
+    counts = pd.crosstab(records_df[settings['party_label']], records_df[settings['status_label']])
+    counts = counts.reindex(columns=counts.columns.union([ON_TIME_STATUS, LATE_STATUS]), fill_value=0)
+
+    status_counts = counts.sum()
+    total = int(status_counts.sum())
+    metrics = {
+        'total': total,
+        'status_counts': status_counts,
+        'on_time_percentage': status_counts[ON_TIME_STATUS] / total * 100 if total else 0.0,
+        'best': None,
+        'worst': None
+    }
+    # Ties go to the first party in alphabetical order
+    if status_counts[ON_TIME_STATUS] > 0:
+        metrics['best'] = (counts[ON_TIME_STATUS].idxmax(), int(counts[ON_TIME_STATUS].max()))
+    if status_counts[LATE_STATUS] > 0:
+        metrics['worst'] = (counts[LATE_STATUS].idxmax(), int(counts[LATE_STATUS].max()))
+    return metrics
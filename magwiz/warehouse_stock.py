@@ -0,0 +1,25 @@
+from magwiz.product_search import matches_product_name
+from magwiz.query_builder import build_where, in_values
+from magwiz.query_cache import read_query
+
+
+# Function to load the available quantity of every product per date and warehouse, for the requested dates only
+def load_inventory_status(conn, dates, warehouses=None, product_name=None):
+    # Filters are bound as parameters, so the SQL text only depends on which filters are used
+    where_clause, params = build_where([
+        in_values('s.stock_day', dates),
+        in_values('m.warehouse_name', warehouses) if warehouses else None,
+        matches_product_name('s.product_code', product_name) if product_name else None
+    ])
+    query = f"""
+        SELECT
+            s.stock_day AS 'Stock Date',
+            p.product_name AS 'Product Name',
+            m.warehouse_name AS 'Warehouse Name',
+            s.quantity_available AS 'Quantity Available'
+        FROM WarehouseStock s
+        JOIN Products p ON s.product_code = p.product_code
+        JOIN Warehouses m ON s.warehouse_id = m.warehouse_id
+        {where_clause}
+    """
+    return read_query(query, conn, params=params)
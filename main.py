@@ -31,6 +31,7 @@ def main():
     - **Order Timeliness (🚚):** Monitor the timeliness of deliveries and shipments, and identify delays to optimize logistics processes.
     - **Order Fulfillment Time (⏱️):** Track the time it takes to fulfill deliveries and orders to ensure timely deliveries and optimize logistics processes.
     - **Warehouse Fill Levels (📈):** Check warehouse fill levels and make decisions on their optimal usage.
+    - **Reorder Forecast (🔮):** Forecast demand, reorder points and stock-out dates to reorder products before they run out.
     """)
 
     st.write("Please select one of the options from the panel on the left side.")
@@ -44,7 +45,8 @@ def main():
             Page("pages/4_abc_analysis.py", "ABC Analysis", "📊"),
             Page("pages/5_order_timeliness.py", "Order Timeliness", "🚚"),
             Page("pages/6_order_fulfillment_time.py", "Order Fulfillment Time", "⏱️"),
-            Page("pages/7_warehouse_fill_levels.py", "Warehouse Fill Levels", "📈")
+            Page("pages/7_warehouse_fill_levels.py", "Warehouse Fill Levels", "📈"),
+            Page("pages/8_reorder_forecast.py", "Reorder Forecast", "🔮")
         ]
     )
 
@@ -1,15 +1,23 @@
 import streamlit as st
-import pandas as pd
-import sqlite3
 import os
 import datetime
+from magwiz.data_sync import DATA_FOLDER, EXCEL_FILES, hash_file
+from magwiz.db import get_connection
+from magwiz.excel_cache import count_workbook_rows
+from magwiz.import_jobs import (JOB_CANCELLED, JOB_COMPLETED, JOB_RUNNING, cancel_import_job, get_latest_job_id, is_job_running,
+                                load_job, load_job_tables, start_import_job)
+from magwiz.table_browser import MAX_COUNTED_ROWS, PAGE_SIZE, count_filtered_rows, fetch_page, get_browser_columns
+
+# Seconds between two refreshes of the progress of a running import
+JOB_REFRESH_SECONDS = 1
 
 # Function to fetch names of existing tables from the database
 def get_table_names(conn):
     cursor = conn.cursor()
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
     tables = cursor.fetchall()
-    return [table[0] for table in tables]
+    # Skip internal tables which do not come from the Excel files
+    return [table[0] for table in tables if table[0] in EXCEL_FILES.values()]
 
 # Function to fetch names of existing tables from the database along with Excel file size and last modification date
 def get_table_names_with_excel_info(conn, folder_path):
@@ -21,10 +29,12 @@ def get_table_names_with_excel_info(conn, folder_path):
     tables = cursor.fetchall()
     # List to store information about tables
     table_names_with_info = []
+    # Excel file names of the tables
+    excel_files_by_table = {table_name: excel_file for excel_file, table_name in EXCEL_FILES.items()}
     # Iterate over each table name
     for table in tables:
         table_name = table[0]  # Get the table name
-        excel_file = f"{table_name}.xlsx"  # Create the corresponding Excel file name
+        excel_file = excel_files_by_table.get(table_name, f"{table_name}.xlsx")  # Get the corresponding Excel file name
         excel_path = os.path.join(folder_path, excel_file)  # Create the path to the Excel file
         # Check if the Excel file exists
         if os.path.exists(excel_path):
@@ -33,79 +43,101 @@ def get_table_names_with_excel_info(conn, folder_path):
             modification_time = os.path.getmtime(excel_path)  # Get the file modification time
             modification_time_str = datetime.datetime.fromtimestamp(modification_time).strftime(
                 '%d-%m-%Y %H:%M:%S')  # Format the modification date
+            num_rows = count_workbook_rows(excel_path, hash_file(excel_path))  # Get the number of rows, read from the columnar cache when available
             # Add table information to the list
-            table_names_with_info.append((table_name, size_mb, modification_time_str))
+            table_names_with_info.append((excel_file, size_mb, modification_time_str, num_rows))
     # Return the list with table information
     return table_names_with_info
 
-# Function to fetch records from the selected table
-def get_first_last_records(conn, table_name):
-    query = f"SELECT * FROM {table_name}"
-    df = pd.read_sql_query(query, conn)
-
-    return df
-
-# Function to remove duplicates from the first column of a table
-def remove_duplicates(conn, table_name):
-    query = f"SELECT * FROM {table_name}"
-    df = pd.read_sql_query(query, conn)
-    primary_key = df.columns[0]
-    num_records_before = len(df)
-    df.drop_duplicates(subset=primary_key, keep='first', inplace=True)
-    num_records_after = len(df)
-    num_duplicates_removed = num_records_before - num_records_after
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
-    
-    return num_duplicates_removed
-
-# Function to update data from Excel files
-def update_data(conn):
-    folder_path = 'Data'
-    excel_files = {
-        'suppliers.xlsx': 'Suppliers',
-        'products.xlsx': 'Products',
-        'warehouses.xlsx': 'Warehouses',
-        'warehouse_stock.xlsx': 'WarehouseStock',
-        'customers.xlsx': 'Customers',
-        'orders.xlsx': 'Orders',
-        'order_details.xlsx': 'OrderDetails',
-        'deliveries.xlsx': 'Deliveries',
-        'delivery_details.xlsx': 'DeliveryDetails'
-    }
-
-    for excel_file, table_name in excel_files.items():
-        excel_path = os.path.join(folder_path, excel_file)
-        if os.path.exists(excel_path):
-            existing_data = pd.read_sql_query(f"SELECT * FROM {table_name}", conn)
-            new_data = pd.read_excel(excel_path)
-            
-            # Remove duplicates in the first column
-            num_duplicates_removed = remove_duplicates(conn, table_name)
-            if num_duplicates_removed > 0:
-                st.write(f"Removed {num_duplicates_removed} duplicates from the '{table_name}' table.")
-            
-            # Add new records
-            new_records = new_data[~new_data.iloc[:, 0].isin(existing_data.iloc[:, 0])]
-            num_added_records = len(new_records)
-            new_records.to_sql(table_name, conn, if_exists='append', index=False)
-            st.write(f"Added {num_added_records} new records to the '{table_name}' table.")
-            
-            # Remove records that do not exist in the Excel file but exist in the database
-            records_to_delete = existing_data[~existing_data.iloc[:, 0].isin(new_data.iloc[:, 0])]
-            num_deleted_records = len(records_to_delete)
-            if num_deleted_records > 0:
-                for index, row in records_to_delete.iterrows():
-                    cursor = conn.cursor()
-                    cursor.execute(f"DELETE FROM {table_name} WHERE {existing_data.columns[0]} = ?", (row[existing_data.columns[0]],))
-                    conn.commit()
-                st.write(f"Deleted {num_deleted_records} records from the '{table_name}' table.")
-        else:
-            st.write(f"The file '{excel_file}' does not exist. Skipping...")
-
-
-# Connection to the SQLite database
-conn = sqlite3.connect('db_inventory.db')
-
+# Function to remember whether the content of the selected table is displayed
+def set_show_records(show):
+    st.session_state['show_records'] = show
+
+# Function to move the table browser to the next or previous page
+def change_page(step):
+    cursors = st.session_state['browser_cursors']
+    if step > 0 and st.session_state.get('browser_next_cursor') is not None:
+        cursors.append(st.session_state['browser_next_cursor'])
+    elif step < 0 and len(cursors) > 1:
+        cursors.pop()
+
+# Function to display one page of the selected table with its sort and filter controls
+def show_table_browser(table_name):
+    with get_connection() as conn:
+        columns = get_browser_columns(conn, table_name)
+
+    sort_column = st.selectbox('Sort by', columns)
+    descending = st.checkbox('Descending order')
+    filters = {}
+    with st.expander('Filters (text, or a comparison such as >= 10)'):
+        filter_columns = st.columns(min(len(columns), 4))
+        for index, column in enumerate(columns):
+            filters[column] = filter_columns[index % len(filter_columns)].text_input(column, key=f"filter_{table_name}_{column}")
+
+    # Start again from the first page when the table, sort order or filters change
+    browser_state = (table_name, sort_column, descending, tuple(filters.values()))
+    if st.session_state.get('browser_state') != browser_state:
+        st.session_state['browser_state'] = browser_state
+        st.session_state['browser_cursors'] = [None]
+    cursors = st.session_state['browser_cursors']
+
+    # Only the rows of the displayed page are read from the database
+    with get_connection() as conn:
+        df, next_cursor = fetch_page(conn, table_name, sort_column, descending, filters, cursors[-1])
+        num_rows = count_filtered_rows(conn, table_name, filters)
+    st.session_state['browser_next_cursor'] = next_cursor
+
+    first_row = (len(cursors) - 1) * PAGE_SIZE + 1
+    last_row = first_row + len(df) - 1
+    if any(text.strip() for text in filters.values()):
+        num_rows_text = f"{MAX_COUNTED_ROWS}+" if num_rows > MAX_COUNTED_ROWS else str(num_rows)
+    else:
+        num_rows_text = f"about {num_rows}"
+    st.write(f"Rows {first_row if len(df) else 0}-{last_row} of {num_rows_text}")
+    st.dataframe(df, hide_index=True)
+
+    previous_column, next_column = st.columns(2)
+    previous_column.button('Previous page', on_click=change_page, args=(-1,), disabled=len(cursors) == 1)
+    next_column.button('Next page', on_click=change_page, args=(1,), disabled=next_cursor is None)
+
+# Function to forget the import whose messages are displayed
+def clear_import_job():
+    st.session_state.pop('import_job_id', None)
+
+# Function to display the progress of the tables, the messages and the result of an import job
+# The import runs in a background thread, so this part of the page refreshes on its own while the job runs
+def show_import_job(job_id, was_running):
+    job = load_job(job_id)
+    if job is None:
+        return
+    running = job['status'] == JOB_RUNNING
+    if was_running and not running:
+        # Rerun the whole page once the import is done, so it displays the new data
+        st.rerun()
+
+    tables_df = load_job_tables(job_id)
+    read_tables = tables_df[tables_df['total_rows'].notna()]
+    if running:
+        st.write(f"Update started at {job['started_at']} is running. Other pages display the previous data until it completes.")
+        if len(read_tables):
+            st.progress(min(read_tables['rows_read'].sum() / read_tables['total_rows'].sum(), 1.0))
+        if is_job_running(job_id):
+            st.button("Cancel update", on_click=cancel_import_job, args=(job_id,))
+
+    tables_df.columns = ['Table', 'Status', 'Rows Read', 'Total Rows', 'Rows/s', 'Added', 'Updated', 'Deleted']
+    st.dataframe(tables_df.round({'Rows/s': 0}), hide_index=True)
+    for message in job['messages'].splitlines():
+        st.write(message)
+
+    if job['status'] == JOB_COMPLETED:
+        st.write(f"Update completed at {job['finished_at']}.")
+    elif job['status'] == JOB_CANCELLED:
+        st.warning(job['error'])
+    elif not running:
+        st.error(f"Update failed, no data was changed. {job['error']}")
+    if not running:
+        # Display a button to clear messages only if the update was performed
+        st.button("Clear messages", on_click=clear_import_job)
 
 # Streamlit page
 def main():
@@ -116,11 +148,17 @@ def main():
     st.markdown('---')
 
     if update_button:
-        messages_to_clear = st.empty()  # Store message state
-        update_data(conn)
-        st.write("Update completed.")
-        # Display a button to clear messages only if the update was performed
-        st.button("Clear messages")
+        # The import runs in the background on the single write connection, while all sessions keep reading
+        st.session_state['import_job_id'] = start_import_job()
+
+    # Sessions which did not start the running import display its progress too
+    job_id = st.session_state.get('import_job_id')
+    if job_id is None:
+        latest_job_id = get_latest_job_id()
+        job_id = latest_job_id if latest_job_id is not None and is_job_running(latest_job_id) else None
+    if job_id is not None:
+        running = is_job_running(job_id)
+        st.fragment(show_import_job, run_every=JOB_REFRESH_SECONDS if running else None)(job_id, running)
 
     st.title('Available Excel files')
     
@@ -129,11 +167,12 @@ def main():
     hide_files = False
 
     if show_files:
-        folder_path = 'Data'
-        table_names_with_info = get_table_names_with_excel_info(conn, folder_path)
+        folder_path = DATA_FOLDER
+        with get_connection() as conn:
+            table_names_with_info = get_table_names_with_excel_info(conn, folder_path)
         if table_names_with_info:
-            for table_name, size_mb, modification_time_str in table_names_with_info:
-                st.write(f"- {table_name}.xlsx (size: {size_mb:.2f} MB, last modification: {modification_time_str})")
+            for excel_file, size_mb, modification_time_str, num_rows in table_names_with_info:
+                st.write(f"- {excel_file} (size: {size_mb:.2f} MB, rows: {num_rows}, last modification: {modification_time_str})")
         else:
             st.write("No files.")
         hide_files = st.button('Hide information')
@@ -144,21 +183,17 @@ def main():
     st.markdown('---')
     st.title('Displaying file content')
 
-    table_names = get_table_names(conn)
+    with get_connection() as conn:
+        table_names = get_table_names(conn)
     selected_table = st.selectbox('Select available file', table_names)
     st.write(f"Selected file: {selected_table}")
 
-    show_records = st.button('Show content')
-    hide_records = False
+    st.button('Show content', on_click=set_show_records, args=(True,))
 
-    if show_records:
-        df = get_first_last_records(conn, selected_table)
+    if st.session_state.get('show_records'):
         st.write("Current data:")
-        st.dataframe(df, hide_index=True)
-        hide_records = st.button('Hide content')
-
-    if hide_records:
-        st.text("Content hidden.")
+        show_table_browser(selected_table)
+        st.button('Hide content', on_click=set_show_records, args=(False,))
 
 if __name__ == "__main__":
     main()
@@ -1,72 +1,49 @@
-import sqlite3
-import pandas as pd
 import streamlit as st
-import io
 import plotly.express as px
-
-def connect_db():
-    return sqlite3.connect('db_inventory.db')
-
-def get_data(selected_dates, selected_magazines, product_name):
-    conn = connect_db()
-    dates_filter = "'" + "', '".join(selected_dates) + "'"
-    magazines_filter = "'" + "', '".join(selected_magazines) + "'" if selected_magazines else "ALL"
-    where_clause = f"DATE(s.stock_date) IN ({dates_filter})"
-    if selected_magazines:
-        where_clause += f" AND m.warehouse_name IN ({magazines_filter})"
-    if product_name:
-        where_clause += f" AND p.product_name LIKE '%{product_name}%'"
-    query = f"""
-    SELECT 
-        DATE(s.stock_date) AS Stock_Date,
-        p.product_name AS Product_Name,
-        m.warehouse_name AS Warehouse_Name,
-        s.quantity_available AS Quantity_Available
-    FROM 
-        WarehouseStock s
-    JOIN 
-        Products p ON s.product_code = p.product_code
-    JOIN 
-        Warehouses m ON s.warehouse_id = m.warehouse_id
-    WHERE 
-        {where_clause};
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
+from magwiz.db import get_connection
+from magwiz.export import EXPORT_FORMATS, prepare_download
+from magwiz.product_search import search_products
+from magwiz.query_builder import build_where, in_values
+from magwiz.query_cache import get_data_version, read_query
+from magwiz.warehouse_stock import load_inventory_status
 
 def get_chart_data(selected_dates, selected_magazines):
-    conn = connect_db()
-    dates_filter = "'" + "', '".join(selected_dates) + "'"
-    magazines_filter = "'" + "', '".join(selected_magazines) + "'" if selected_magazines else "ALL"
-    where_clause = f"DATE(s.stock_date) IN ({dates_filter})"
-    if selected_magazines:
-        where_clause += f" AND m.warehouse_name IN ({magazines_filter})"
+    where_clause, params = build_where([
+        in_values('d.day', selected_dates),
+        in_values('m.warehouse_name', selected_magazines) if selected_magazines else None
+    ])
+    # The totals per day and warehouse are precomputed during the data update
     query = f"""
     SELECT 
-        DATE(s.stock_date) AS Stock_Date,
+        d.day AS Stock_Date,
         m.warehouse_name AS Warehouse_Name,
-        SUM(s.quantity_available) AS Quantity_Available
+        d.total_quantity AS Quantity_Available
     FROM 
-        WarehouseStock s
+        DailyWarehouseSummary d
     JOIN 
-        Warehouses m ON s.warehouse_id = m.warehouse_id
-    WHERE 
-        {where_clause}
-    GROUP BY 
-        DATE(s.stock_date), m.warehouse_name;
+        Warehouses m ON d.warehouse_id = m.warehouse_id
+    {where_clause}
+    ORDER BY 
+        d.day, m.warehouse_name;
     """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
+    with get_connection() as conn:
+        df = read_query(query, conn, params=params)
     return df
 
+# Function to suggest product names close to a search text which matched no products
+def show_product_suggestions(product_name):
+    with get_connection() as conn:
+        suggestions = search_products(conn, product_name)
+    if not suggestions.empty:
+        st.write("No products match the filter. Did you mean: " + ", ".join(suggestions['product_name'].head(5)) + "?")
+
 def main():
-    conn = connect_db()
-    dates_query = "SELECT DISTINCT DATE(stock_date) AS stock_date FROM WarehouseStock ORDER BY stock_date ASC;"
-    dates = pd.read_sql_query(dates_query, conn)['stock_date'].tolist()
+    dates_query = "SELECT DISTINCT day AS stock_date FROM DailyWarehouseSummary ORDER BY day ASC;"
     magazines_query = "SELECT DISTINCT warehouse_name FROM Warehouses;"
-    magazines = pd.read_sql_query(magazines_query, conn)['warehouse_name'].tolist()
-    conn.close()
+    with get_connection() as conn:
+        data_version = get_data_version(conn)
+        dates = read_query(dates_query, conn)['stock_date'].tolist()
+        magazines = read_query(magazines_query, conn)['warehouse_name'].tolist()
     latest_date = max(dates) if dates else None
 
     st.write("# Inventory Status on Selected Date")
@@ -75,19 +52,19 @@ def main():
     product_name = st.text_input("Enter product name to filter:")
     if not selected_dates and latest_date:
         selected_dates = [latest_date]
-    df = get_data(selected_dates, selected_magazines, product_name)
-    df = df.rename(columns={"Stock_Date": "Stock Date", "Product_Name": "Product Name", "Warehouse_Name": "Warehouse Name", "Quantity_Available": "Quantity Available"})
+    with get_connection() as conn:
+        df = load_inventory_status(conn, selected_dates, selected_magazines, product_name)
+    if product_name and df.empty:
+        show_product_suggestions(product_name)
     st.dataframe(df, hide_index=True)
 
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-         df.to_excel(writer, index=False, sheet_name='Sheet1')
-    output.seek(0)
+    # The file is only generated when the button is clicked
+    export_format = st.radio("Download format:", list(EXPORT_FORMATS), horizontal=True)
+    export_key = ('inventory_status', tuple(selected_dates), tuple(selected_magazines), product_name)
     st.download_button(
-          label="Download as Excel file",
-          data=output.getvalue(),
-          file_name="inventory_status.xlsx",
-         mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+          label=f"Download as {export_format} file",
+          on_click='ignore',
+          **prepare_download(df, export_key, export_format, data_version, "inventory_status")
       )
     st.markdown('---')
 
@@ -1,52 +1,30 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import io
 import plotly.graph_objects as go
 import plotly.express as px
+from magwiz.db import get_connection
+from magwiz.export import EXPORT_FORMATS, prepare_download
+from magwiz.query_cache import get_data_version, read_query
+from magwiz.shortage_alerts import load_open_shortages
+from magwiz.shortages import get_stock_dates, load_shortages, summarize_shortages
 
-# Function to establish a connection to the database
-def connect_db():
-    conn = sqlite3.connect('db_inventory.db')
-    return conn
-
-# Function to load data from the database
-def load_data(conn):
-    query = """
-        SELECT DATE(sm.stock_date) AS 'Stock Date',
-               p.product_name AS 'Product Name',
-               sm.quantity_available AS 'Quantity Available',
-               p.safety_stock AS 'Safety Stock'
-        FROM WarehouseStock sm
-        JOIN Products p ON sm.product_code = p.product_code
-        WHERE sm.quantity_available < p.safety_stock
-        ORDER BY sm.stock_date, p.product_name
-    """
-    df = pd.read_sql_query(query, conn)
-    return df
+# Function to load available warehouses
+def load_available_warehouses(conn):
+    query = "SELECT DISTINCT warehouse_name FROM Warehouses ORDER BY warehouse_name"
+    return read_query(query, conn)['warehouse_name'].tolist()
 
 # Function to generate the bar chart
-def generate_plot(df, selected_dates, search_term):
+def generate_plot(totals_df):
     fig = go.Figure()
     
     # Define a color palette for the bars
     colors = px.colors.qualitative.Plotly
-    
-    # Sort selected dates in ascending order
-    selected_dates.sort()
-
-    for i, date in enumerate(selected_dates):
-        filtered_df = df[df['Stock Date'] == date]
-
-        if search_term:
-            filtered_df = filtered_df[filtered_df['Product Name'].str.contains(search_term, case=False)]
-
-        shortages = abs(filtered_df['Quantity Available'] - filtered_df['Safety Stock']).sum()
 
+    # Totals of the selected dates are computed by the database, in ascending order of dates
+    for i, (date, totals) in enumerate(totals_df.iterrows()):
         fig.add_trace(go.Bar(
             name=f'{date}',
             x=['Quantity Available', 'Minimum Quantity'],
-            y=[filtered_df['Quantity Available'].sum(), shortages],
+            y=[totals['Total Available'], totals['Total Missing']],
             marker_color=colors[i % len(colors)]  # Use modulo to cycle through colors if more dates than colors
         ))
 
@@ -57,57 +35,58 @@ def generate_plot(df, selected_dates, search_term):
 def main():
     st.title('Display Products Requiring Restock')
 
-    conn = connect_db()
-    df = load_data(conn)
-    conn.close()
+    with get_connection() as conn:
+        dates = get_stock_dates(conn)
+        warehouses = load_available_warehouses(conn)
+        open_shortages_df = load_open_shortages(conn)
 
-    latest_date = df['Stock Date'].max()
+    # Display the shortages which are still open in the latest stock snapshots
+    st.subheader(f'Open shortage alerts: {len(open_shortages_df)}')
+    st.dataframe(open_shortages_df, hide_index=True)
+    st.markdown('---')
 
-    selected_dates = st.multiselect('Select dates to filter:', df['Stock Date'].unique(), default=[latest_date])
+    latest_date = dates[-1] if dates else None
+
+    selected_dates = st.multiselect('Select dates to filter:', dates, default=[latest_date] if latest_date else [])
     
     # If no date is selected, use the most recent available date
-    if not selected_dates:
+    if not selected_dates and latest_date:
         selected_dates = [latest_date]
 
+    selected_warehouses = st.multiselect('Select warehouses:', warehouses)
+
     search_term = st.text_input("Enter product name to filter:")
 
-    # Add a "Stock Difference" column
-    df['Missing Quantity'] = df['Safety Stock'] - df['Quantity Available']
+    # Only the shortages of the selected dates, warehouses and products are loaded
+    with get_connection() as conn:
+        data_version = get_data_version(conn)
+        shortages_df = load_shortages(conn, selected_dates, selected_warehouses, search_term)
+    totals_df = summarize_shortages(shortages_df, selected_dates)
 
     # Display the filtered data table
-    filtered_df = df[df['Stock Date'].isin(selected_dates)]
-    if search_term:
-        filtered_df = filtered_df[filtered_df['Product Name'].str.contains(search_term, case=False)]
+    filtered_df = shortages_df.drop(columns=['Total Available', 'Total Missing'])
     st.dataframe(filtered_df.drop(columns=['Stock Date']), hide_index=True)
 
     # Add button to download the data as an Excel file
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        filtered_df.to_excel(writer, index=False, sheet_name='Sheet1')
-    output.seek(0)
+    # The file is only generated when the button is clicked
+    export_format = st.radio("Download format:", list(EXPORT_FORMATS), horizontal=True)
+    export_key = ('inventory_shortages', tuple(selected_dates), tuple(selected_warehouses), search_term)
     st.download_button(
-        label="Download as Excel file",
-        data=output.getvalue(),
-        file_name="inventory_shortages.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        label=f"Download as {export_format} file",
+        on_click='ignore',
+        **prepare_download(filtered_df, export_key, export_format, data_version, "inventory_shortages")
     )
     st.markdown('---')
 
     # Display warehouse shortages for each selected date
-    for date in selected_dates:
-        # Filter data for the specific date
-        filtered_date_df = filtered_df[filtered_df['Stock Date'] == date]
-
-        # Calculate shortages for the selected date
-        shortages_date = abs(filtered_date_df['Quantity Available'] - filtered_date_df['Safety Stock']).sum()
-
+    for date, totals in totals_df.iterrows():
         # Display the shortage count as a metric in the Streamlit app
-        st.metric(label=f"Warehouse shortages for {date}", value=int(shortages_date))
+        st.metric(label=f"Warehouse shortages for {date}", value=int(totals['Total Missing']))
 
     st.markdown('---')
     # Generate the bar chart
-    fig = generate_plot(df, selected_dates, search_term)
-    st.plotly_chart(fig, use_container_width=True)
+    fig = generate_plot(totals_df)
+    st.plotly_chart(fig, width='stretch')
 
 if __name__ == "__main__":
     main()
@@ -1,46 +1,10 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import io
 import plotly.express as px
-from datetime import datetime
-
-# Function to load data
-def load_data():
-    conn = sqlite3.connect('db_inventory.db')
-    query = """
-    SELECT
-        o.order_date AS 'Order Date',
-        p.product_code AS 'Product Code',
-        p.product_name AS 'Product Name',
-        od.quantity AS 'Sales Quantity'
-    FROM 
-        OrderDetails od
-    JOIN 
-        Orders o ON od.order_id = o.order_id
-    JOIN 
-        Products p ON od.product_code = p.product_code;
-    """
-    df = pd.read_sql_query(query, conn)
-    conn.close()
-    return df
-
-# Function to perform ABC analysis
-def analyze_abc(df):
-    # Calculate total sales for each product
-    df['Total Sales'] = df.groupby(['Product Name'])['Sales Quantity'].transform('sum')
-    # Calculate percentage share of sales for each product
-    df['Sales Percentage'] = df['Total Sales'] / df['Total Sales'].sum() * 100
-    # Sort data by sales percentage in descending order
-    df.sort_values(by='Sales Percentage', ascending=False, inplace=True)
-    # Calculate cumulative percentage of sales
-    df['Cumulative Percentage'] = df['Sales Percentage'].cumsum()
-    # Assign ABC categories based on cumulative sales percentage
-    df['ABC Category'] = pd.cut(df['Cumulative Percentage'], bins=[0, 20, 50, 100], labels=['A', 'B', 'C'])
-    # Round sales percentages and cumulative percentage, and add '%' symbol
-    df['Sales Percentage'] = df['Sales Percentage'].round(2).astype(str) + '%'
-    df['Cumulative Percentage'] = df['Cumulative Percentage'].round(2).astype(str) + '%'
-    return df
+from magwiz.abc_analysis import (DEFAULT_THRESHOLDS, DEFAULT_XYZ_THRESHOLDS, WEIGHTINGS, build_abc_xyz_matrix,
+                                 build_channel_breakdown, classify_products, format_abc_report, get_order_date_range)
+from magwiz.db import get_connection
+from magwiz.export import EXPORT_FORMATS, prepare_download
+from magwiz.query_cache import get_data_version
 
 # Function to display metrics
 def display_metrics(metrics, metric_names):
@@ -63,17 +27,21 @@ def display_metrics(metrics, metric_names):
 def main():
     st.title('ABC Analysis of Product Sales')
 
-    # Load data
-    df = load_data()
-    df['Order Date'] = pd.to_datetime(df['Order Date']).dt.date
+    # Load the range of order dates
+    with get_connection() as conn:
+        min_date, max_date = get_order_date_range(conn)
+    if min_date is None:
+        st.write("No orders.")
+        return
 
     # Date range sliders
-    min_date = min(df['Order Date'])
-    max_date = max(df['Order Date'])
     start_date = st.date_input("Select start date", min_value=min_date, max_value=max_date, value=min_date)
     end_date = st.date_input("Select end date", min_value=min_date, max_value=max_date, value=max_date)
-    start_date = datetime.combine(start_date, datetime.min.time())
-    end_date = datetime.combine(end_date, datetime.max.time())
+
+    # Classification settings
+    weighting = st.selectbox("Rank products by", list(WEIGHTINGS), format_func=WEIGHTINGS.get)
+    thresholds = st.slider("Cumulative sales share of categories A and B (%)", min_value=1, max_value=99, value=DEFAULT_THRESHOLDS)
+    xyz_thresholds = st.slider("Coefficient of variation of weekly demand of categories X and Y", min_value=0.1, max_value=3.0, value=DEFAULT_XYZ_THRESHOLDS, step=0.1)
 
     # Check date validity
     if start_date > end_date:
@@ -81,31 +49,23 @@ def main():
     elif start_date == end_date:
         st.error("Error: Start date and end date cannot be the same!")
     else:
-        # Filter data by selected dates
-        filtered_df = df[(df['Order Date'] >= start_date.date()) & (df['Order Date'] <= end_date.date())]
-        abc_df = analyze_abc(filtered_df)
-        abc_df.drop(columns=['Product Code', 'Order Date', 'Sales Quantity'], inplace=True)
-        abc_df.rename(columns={
-            #'Product Name': 'Product Name',
-            'Sales Total': 'Sales Total',
-            'Sales Percentage': 'Sales Percentage',
-            'Cumulative': 'Cumulative',
-            'ABC Analysis': 'ABC Analysis'
-        }, inplace=True)
+        # Sales of the selected dates are read from the sales indexes, which the data update keeps up to date
+        with get_connection() as conn:
+            data_version = get_data_version(conn)
+            abc_df, channels = classify_products(conn, start_date, end_date, weighting, thresholds, xyz_thresholds)
+        # Round sales percentages and cumulative percentage, and add '%' symbol
+        abc_df = format_abc_report(abc_df)
 
         # Display filtered data as a report
         st.dataframe(abc_df, hide_index=True)
 
-        # Button to download data as Excel file
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            abc_df.to_excel(writer, index=False, sheet_name='Sheet1')
-        output.seek(0)
+        # Button to download data, the file is only generated when it is clicked
+        export_format = st.radio("Download format:", list(EXPORT_FORMATS), horizontal=True)
+        export_key = ('abc_analysis', start_date, end_date, weighting, tuple(thresholds), tuple(xyz_thresholds))
         st.download_button(
-            label="Download as Excel file",
-            data=output.getvalue(),
-            file_name="abc_analysis.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            label=f"Download as {export_format} file",
+            on_click='ignore',
+            **prepare_download(abc_df, export_key, export_format, data_version, "abc_analysis")
         )
         st.markdown('---')  
 
@@ -126,6 +86,21 @@ def main():
         st.plotly_chart(fig)
         st.markdown('---')  
 
+        # ABC/XYZ matrix
+        st.subheader('ABC/XYZ matrix (number of products)')
+        matrix_counts, matrix_values = build_abc_xyz_matrix(abc_df)
+        fig = px.imshow(matrix_counts, text_auto=True, color_continuous_scale='Blues', labels={'color': 'Products'})
+        fig.update_traces(customdata=matrix_values.values, hovertemplate='%{y}%{x}: %{z} products<br>Sales value: %{customdata:,.2f}<extra></extra>')
+        st.plotly_chart(fig)
+        st.markdown('---')
+
+        # Sales channel breakdown
+        st.subheader(f"{WEIGHTINGS[weighting]} per sales channel in each category")
+        channel_breakdown = build_channel_breakdown(abc_df, channels).reset_index()
+        fig = px.bar(channel_breakdown, x='ABC Category', y=channels, barmode='group', labels={'value': WEIGHTINGS[weighting], 'variable': 'Sales Channel'})
+        st.plotly_chart(fig)
+        st.markdown('---')
+
         # Display top product
         top_product = abc_df.nlargest(1, 'Total Sales').iloc[0]
         top_product_info = f"<div style='display:flex; justify-content: space-between;'><div><h3>Top Product</h3><p>{top_product['Product Name']}</p></div><div><h3>Sales</h3><p>{top_product['Total Sales']}</p></div></div>"
@@ -1,192 +1,126 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
 import plotly.graph_objects as go
-import io
-from datetime import datetime
-
-# Function to load data
-def load_data(option):
-    # Connection to SQLite3 database
-    conn = sqlite3.connect('db_inventory.db')
-
-    if option == "Delivery Lead Time":
-        # SQL query for supplier data
-        query = """
-        SELECT 
-            DS.delivery_id AS 'Delivery Number',
-            S.supplier_name AS 'Supplier Name', 
-            DATE(DS.order_date) AS 'Order Date', 
-            DATE(DS.delivery_date) AS 'Delivery Date', 
-            (julianday(DS.delivery_date) - julianday(DS.order_date)) AS 'Lead Time (days)'
-        FROM Deliveries DS
-        JOIN Suppliers S ON DS.supplier_id = S.supplier_id;
-        """
-    elif option == "Shipping Lead Time":
-        # SQL query for customer data
-        query = """
-        SELECT 
-            O.order_id AS 'Order Number',
-            C.customer_name AS 'Customer Name', 
-            DATE(O.order_date) AS 'Order Date', 
-            DATE(O.shipping_date) AS 'Shipping Date', 
-            (julianday(O.shipping_date) - julianday(O.order_date)) AS 'Lead Time (days)'
-        FROM Orders O
-        JOIN Customers C ON O.customer_id = C.customer_id;
-        """
-
-    # Execute the query and load results into a DataFrame
-    df = pd.read_sql_query(query, conn)
-
-    # Close the connection to the database
-    conn.close()
-
-    return df
+from magwiz.db import get_connection
+from magwiz.export import EXPORT_FORMATS, prepare_download
+from magwiz.lead_time import (ROLLING_WINDOWS, get_overall_mean, load_lead_time_records, load_lead_time_statistics,
+                              load_lead_time_trend)
+from magwiz.query_cache import get_data_version
+from magwiz.timeliness import get_timeliness_date_range
+
+# Texts of the page for each option, with the kind of lead time it displays
+OPTIONS = {
+    "Delivery Lead Time": {
+        'kind': 'delivery',
+        'subheader': "Delivery Lead Time",
+        'file_stem': "delivery_lead_time",
+        'average_title': "Average delivery lead time from {start_date} to {end_date}",
+        'fastest_label': "Fastest Supplier",
+        'slowest_label': "Slowest Supplier",
+        'average_label': "Average Lead Time (days)",
+        'statistics_title': "Lead time statistics per supplier (days)"
+    },
+    "Shipping Lead Time": {
+        'kind': 'shipping',
+        'subheader': "Shipping Lead Time",
+        'file_stem': "shipping_lead_time",
+        'average_title': "Average shipping lead time from {start_date} to {end_date}",
+        'fastest_label': "Fastest Customer",
+        'slowest_label': "Slowest Customer",
+        'average_label': "Average Shipping Lead Time (days)",
+        'statistics_title': "Lead time statistics per customer (days)"
+    }
+}
+
+# Function to generate the trend chart of the daily average lead time and its rolling averages
+def generate_trend_plot(trend_df):
+    fig = go.Figure()
+    fig.add_trace(go.Scatter(x=trend_df['Order Date'], y=trend_df['Daily Average'], mode='markers', name='Daily Average', opacity=0.5))
+    for window_days in ROLLING_WINDOWS:
+        column = f"Rolling {window_days}-day Average"
+        fig.add_trace(go.Scatter(x=trend_df['Order Date'], y=trend_df[column], mode='lines', name=column))
+    fig.update_layout(title='Lead time trend', xaxis_title='Order Date', yaxis_title='Lead Time (days)')
+    return fig
+
+# Function to display the fastest or slowest party with its average lead time
+def display_party(label, average_label, name, value):
+    party_info = f"<div style='display:flex; justify-content: space-between;'><div style='text-align: center; padding-right: 10px;'><h3 style='word-wrap: break-word;'>{label}</h3><p>{name}</p></div><div style='text-align: center;'><h3>{average_label}</h3><p>{value:.2f}</p></div></div>"
+    st.markdown(party_info, unsafe_allow_html=True)
+
+# Function to display the lead time of deliveries from suppliers or shipments to customers
+def display_lead_time(texts):
+    kind = texts['kind']
+    st.subheader(texts['subheader'])
+
+    # Interactive date inputs, limited to the dates of the orders
+    with get_connection() as conn:
+        min_date, max_date = get_timeliness_date_range(conn, kind)
+    if min_date is None:
+        st.write("No orders.")
+        return
 
-# Load data based on user's selection
-option = st.sidebar.radio("Select data to display", ("Delivery Lead Time", "Shipping Lead Time"))
-df = load_data(option)
-
-# Display title
-st.title('Order Lead Time Indicator')
-
-# Display data for suppliers
-if option == "Delivery Lead Time":
-    st.subheader("Delivery Lead Time")
-        
-    # Convert date to datetime
-    df['Order Date'] = pd.to_datetime(df['Order Date']).dt.date
-
-    # Interactive date range slider
-    min_date = min(df['Order Date'])
-    max_date = max(df['Order Date'])
     start_date = st.date_input("Select start date", min_value=min_date, max_value=max_date, value=min_date)
     end_date = st.date_input("Select end date", min_value=min_date, max_value=max_date, value=max_date)
 
-    # Convert date to datetime object
-    start_date = datetime.combine(start_date, datetime.min.time())
-    end_date = datetime.combine(end_date, datetime.max.time())
-
     # Validate date range
     if start_date > end_date:
         st.error("Error: Start date cannot be later than end date!")
-    elif start_date == end_date:
-        st.error("Error: Start and end dates cannot be the same!")
-    else:
-        # Filter data based on the selected date range
-        filtered_df = df[(df['Order Date'] >= start_date.date()) & (df['Order Date'] <= end_date.date())]
-        
-        # Display filtered data
-        st.dataframe(filtered_df, hide_index=True)
-
-        # Calculate cycle lead time
-        filtered_df['Cycle Lead Time'] = (pd.to_datetime(filtered_df['Delivery Date']) - pd.to_datetime(filtered_df['Order Date'])).dt.days
-
-        # Add Excel download button
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            filtered_df.to_excel(writer, index=False, sheet_name='Sheet1')
-        output.seek(0)
-        st.download_button(
-            label="Download as Excel file",
-            data=output.getvalue(),
-            file_name="delivery_lead_time.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-        st.markdown('---')
-
-        # Calculate average lead time
-        average_cycle_time = filtered_df['Cycle Lead Time'].mean()
-        # Average lead time in hours
-        average_cycle_time_hours = average_cycle_time * 24
-        st.subheader(f"Average delivery lead time from {start_date.date()} to {end_date.date()}")
-
-        col1, col2 = st.columns(2)
-        with col1:
-            st.metric('', f"{average_cycle_time:.2f} (days)", label_visibility='visible')
-        with col2:
-            st.metric('', f"{average_cycle_time_hours:.2f} (hours)", label_visibility='visible')
-        st.markdown('---')
-    
-    # Calculate average delivery time for each supplier
-    average_delivery_time = filtered_df.groupby('Supplier Name')['Cycle Lead Time'].mean().reset_index()
-    # Find the supplier with the longest average lead time
-    slowest_supplier = average_delivery_time.loc[average_delivery_time['Cycle Lead Time'].idxmax()]
-    # Prepare info about the slowest supplier in HTML format
-    slowest_supplier_info = f"<div style='display:flex; justify-content: space-between;'><div style='text-align: center; padding-right: 10px;'><h3 style='word-wrap: break-word;'>Slowest Supplier</h3><p>{slowest_supplier['Supplier Name']}</p></div><div style='text-align: center;'><h3>Average Lead Time (days)</h3><p>{slowest_supplier['Cycle Lead Time']:.2f}</p></div></div>"
-    # Find the supplier with the shortest average lead time
-    fastest_supplier = average_delivery_time.loc[average_delivery_time['Cycle Lead Time'].idxmin()]
-    fastest_supplier_info = f"<div style='display:flex; justify-content: space-between;'><div style='text-align: center; padding-right: 10px;'><h3 style='word-wrap: break-word;'>Fastest Supplier</h3><p>{fastest_supplier['Supplier Name']}</p></div><div style='text-align: center;'><h3>Average Lead Time (days)</h3><p>{fastest_supplier['Cycle Lead Time']:.2f}</p></div></div>"
-    st.markdown(fastest_supplier_info, unsafe_allow_html=True)
-    # Display info about the slowest supplier
-    st.markdown(slowest_supplier_info, unsafe_allow_html=True)
-
-# Display data for customers
-elif option == "Shipping Lead Time":
-    st.subheader("Shipping Lead Time")
-
-    # Convert date to datetime
-    df['Order Date'] = pd.to_datetime(df['Order Date']).dt.date
-
-    # Interactive date range slider
-    min_date = min(df['Order Date'])
-    max_date = max(df['Order Date'])
-    start_date = st.date_input("Select start date", min_value=min_date, max_value=max_date, value=min_date)
-    end_date = st.date_input("Select end date", min_value=min_date, max_value=max_date, value=max_date)
+        return
+
+    # Lead times and their statistics are computed by the database for the selected period only
+    with get_connection() as conn:
+        data_version = get_data_version(conn)
+        records_df = load_lead_time_records(conn, kind, start_date, end_date)
+        statistics_df = load_lead_time_statistics(conn, kind, start_date, end_date)
+        trend_df = load_lead_time_trend(conn, kind, start_date, end_date)
+
+    # Display filtered data
+    st.dataframe(records_df, hide_index=True)
+
+    # Add download button, the file is only generated when it is clicked
+    export_format = st.radio("Download format:", list(EXPORT_FORMATS), horizontal=True)
+    st.download_button(
+        label=f"Download as {export_format} file",
+        on_click='ignore',
+        **prepare_download(records_df, ('lead_time', kind, start_date, end_date), export_format, data_version, texts['file_stem'])
+    )
 
-    # Convert date to datetime object
-    start_date = datetime.combine(start_date, datetime.min.time())
-    end_date = datetime.combine(end_date, datetime.max.time())
+    st.markdown('---')
 
-    # Validate date range
-    if start_date > end_date:
-        st.error("Error: Start date cannot be later than end date!")
-    elif start_date == end_date:
-        st.error("Error: Start and end dates cannot be the same!")
-    else:
-        # Filter data based on the selected date range
-        filtered_df = df[(df['Order Date'] >= start_date.date()) & (df['Order Date'] <= end_date.date())]
-        
-        # Display filtered data
-        st.dataframe(filtered_df, hide_index=True)
-
-        # Calculate cycle lead time
-        filtered_df['Cycle Lead Time'] = (pd.to_datetime(filtered_df['Shipping Date']) - pd.to_datetime(filtered_df['Order Date'])).dt.days
-
-        # Add Excel download button
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-            filtered_df.to_excel(writer, index=False, sheet_name='Sheet1')
-        output.seek(0)
-        st.download_button(
-            label="Download as Excel file",
-            data=output.getvalue(),
-            file_name="shipping_lead_time.xlsx",
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
-        st.markdown('---')
-
-        # Calculate average lead time
-        average_cycle_time = filtered_df['Cycle Lead Time'].mean()
-        # Average lead time in hours
-        average_cycle_time_hours = average_cycle_time * 24
-        st.subheader(f"Average shipping lead time from {start_date.date()} to {end_date.date()}")
-        col1, col2 = st.columns(2)
-
-        with col1:
-            st.metric('', f"{average_cycle_time:.2f} (days)", label_visibility='visible')
-        with col2:
-            st.metric('', f"{average_cycle_time_hours:.2f} (hours)", label_visibility='visible')
+    # Average lead time in days and hours
+    average_cycle_time = get_overall_mean(statistics_df)
+    average_cycle_time_hours = average_cycle_time * 24
+    st.subheader(texts['average_title'].format(start_date=start_date, end_date=end_date))
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric('', f"{average_cycle_time:.2f} (days)", label_visibility='visible')
+    with col2:
+        st.metric('', f"{average_cycle_time_hours:.2f} (hours)", label_visibility='visible')
+    st.markdown('---')
+
+    if statistics_df.empty:
+        return
+
+    # Parties with the shortest and the longest average lead time
+    party_label = statistics_df.columns[0]
+    fastest = statistics_df.loc[statistics_df['Mean'].idxmin()]
+    slowest = statistics_df.loc[statistics_df['Mean'].idxmax()]
+    display_party(texts['fastest_label'], texts['average_label'], fastest[party_label], fastest['Mean'])
+    display_party(texts['slowest_label'], texts['average_label'], slowest[party_label], slowest['Mean'])
+    st.markdown('---')
 
+    # Lead time statistics of each party
+    st.subheader(texts['statistics_title'])
+    st.dataframe(statistics_df.round(2), hide_index=True)
     st.markdown('---')
 
-    # Calculate average shipping time for each customer
-    average_delivery_time = filtered_df.groupby('Customer Name')['Cycle Lead Time'].mean().reset_index()
-    slowest_customer = average_delivery_time.loc[average_delivery_time['Cycle Lead Time'].idxmax()]
-    slowest_customer_info = f"<div style='display:flex; justify-content: space-between;'><div style='text-align: center; padding-right: 10px;'><h3 style='word-wrap: break-word;'>Slowest Customer</h3><p>{slowest_customer['Customer Name']}</p></div><div style='text-align: center;'><h3>Average Shipping Lead Time (days)</h3><p>{slowest_customer['Cycle Lead Time']:.2f}</p></div></div>"
-    fastest_customer = average_delivery_time.loc[average_delivery_time['Cycle Lead Time'].idxmin()]
-    fastest_customer_info = f"<div style='display:flex; justify-content: space-between;'><div style='text-align: center; padding-right: 10px;'><h3 style='word-wrap: break-word;'>Fastest Customer</h3><p>{fastest_customer['Customer Name']}</p></div><div style='text-align: center;'><h3>Average Shipping Lead Time (days)</h3><p>{fastest_customer['Cycle Lead Time']:.2f}</p></div></div>"
-    st.markdown(fastest_customer_info, unsafe_allow_html=True)
-    st.markdown(slowest_customer_info, unsafe_allow_html=True)
\ No newline at end of file
+    # Trend of the daily average lead time
+    st.plotly_chart(generate_trend_plot(trend_df), width='stretch')
+
+# Load data based on user's selection
+option = st.sidebar.radio("Select data to display", list(OPTIONS))
+
+# Display title
+st.title('Order Lead Time Indicator')
+
+display_lead_time(OPTIONS[option])
@@ -1,127 +1,72 @@
 import streamlit as st
-import sqlite3
 import pandas as pd
-import plotly.graph_objects as go
+import plotly.express as px
+from magwiz.db import get_connection
+from magwiz.fill_levels import DEFAULT_TREND_DAYS, FULL_THRESHOLD, compare_dates, load_fill_levels, project_threshold_crossings
+from magwiz.gauges import create_gauge_grid
+from magwiz.query_cache import read_query
 
 # Function to load available warehouses
 def load_available_warehouses():
-    conn = sqlite3.connect('db_inventory.db')
     query = "SELECT DISTINCT warehouse_name FROM Warehouses"
-    warehouses = pd.read_sql_query(query, conn)['warehouse_name'].tolist()
-    conn.close()
+    with get_connection() as conn:
+        warehouses = read_query(query, conn)['warehouse_name'].tolist()
     return warehouses
 
-# Function to load data for selected warehouses and date
-def load_data(selected_warehouses, selected_date):
-    conn = sqlite3.connect('db_inventory.db')
-
-    # Build the SQL query string for warehouses
-    placeholders = ', '.join(['?' for _ in selected_warehouses])
-
-    query = f"""
-    SELECT 
-        w.warehouse_name,
-        ROUND((SUM(p.unit_volume * ws.quantity_available) / w.capacity) * 100, 2) AS fill_percentage
-    FROM 
-        Warehouses w
-    INNER JOIN 
-        WarehouseStock ws ON w.warehouse_id = ws.warehouse_id
-    INNER JOIN 
-        Products p ON ws.product_code = p.product_code
-    WHERE
-        w.warehouse_name IN ({placeholders})
-        AND DATE(ws.stock_date) = ?
-    GROUP BY 
-        w.warehouse_name, w.capacity;
-    """
-    # SQL query parameters
-    params = selected_warehouses + [selected_date]
-
-    df = pd.read_sql_query(query, conn, params=params)
-    conn.close()
-    return df
-
-# Function to create a gauge chart
-def create_gauge_chart(value, warehouse):
-    colors = ["green", "orange", "red"]
-    thresholds = [0, 50, 90, 100]
-
-    def find_color(val, thresholds, colors):
-        for i in range(len(thresholds) - 1):
-            if thresholds[i] <= val < thresholds[i + 1]:
-                return colors[i]
-        return colors[-1]
-
-    bar_color = find_color(value, thresholds, colors)
-    value_color = find_color(value, thresholds, colors)
-
-    fig = go.Figure(go.Indicator(
-        mode="gauge+number",
-        value=value,
-        domain={'x': [0, 1], 'y': [0, 1]},
-        gauge={
-            'axis': {'range': [None, 100], 'tickfont': {'color': 'black'}, 'tickvals': list(range(0, 101, 10))}, 
-            'bgcolor': 'white',
-            'bar': {'color': bar_color},
-            'borderwidth': 2,
-            'bordercolor': "gray",
-            'threshold': {
-                'line': {'color': "black", 'width': 11},
-                'thickness': 0.9,
-                'value': value}
-        }
-    ))
-
-    fig.update_layout(font={'color': "white", 'family': "Arial"})
-    fig.update_traces(number_font_color=value_color)
-
+# Function to generate the time series chart of the fill levels, with the full threshold
+def generate_time_series_plot(fill_levels):
+    fig = px.line(fill_levels, markers=True, labels={'value': 'Fill Level (%)'})
+    fig.add_hline(y=FULL_THRESHOLD, line_dash='dash', line_color='red', annotation_text=f"{FULL_THRESHOLD}%")
+    fig.update_layout(title='Fill levels over time')
     return fig
 
-# Function to load available dates
-def load_available_dates():
-    conn = sqlite3.connect('db_inventory.db')
-    query = "SELECT DISTINCT DATE(stock_date) as available_date FROM WarehouseStock ORDER BY available_date ASC"
-    dates = pd.read_sql_query(query, conn)['available_date'].tolist()
-    conn.close()
-    return dates
-
 # Main function
 def main():
-    # Load available warehouses and dates
+    # Load available warehouses and the fill levels of all warehouses on all dates at once
     available_warehouses = load_available_warehouses()
-    available_dates = load_available_dates()
+    with get_connection() as conn:
+        fill_levels = load_fill_levels(conn)
+    available_dates = [date.date().isoformat() for date in fill_levels.index]
 
     # Display the title
     st.title('Warehouse Fill Level Indicator')
 
+    if not available_dates:
+        st.write("No stock snapshots.")
+        return
+
     # Date selection
     selected_date = st.selectbox("Select date", available_dates, index=len(available_dates)-1)
 
-    # Warehouse selection using multiselectbox
+    # Warehouse selection using multiselectbox, all warehouses when none is selected
     selected_warehouses = st.multiselect("Select warehouses", available_warehouses)
-
-    # Check if warehouses have been selected
     if selected_warehouses:
-        # Load data for selected warehouses and date
-        df = load_data(selected_warehouses, selected_date)
-
-        # Display gauge charts for each warehouse
-        for warehouse, percentage in zip(df['warehouse_name'], df['fill_percentage']):
-            fig = create_gauge_chart(percentage, warehouse)
-            st.write(f"## Gauge for warehouse '{warehouse}'")
-            st.plotly_chart(fig)
-    else:
-        # Load data for all warehouses and date
-        df = load_data(available_warehouses, selected_date)
-
-        # Display gauge charts for each warehouse
-        for warehouse, percentage in zip(df['warehouse_name'], df['fill_percentage']):
-            # Create the gauge chart for the warehouse
-            fig = create_gauge_chart(percentage, warehouse)
-            # Display the chart title with the warehouse name
-            st.write(f"## Gauge for warehouse '{warehouse}'")
-            # Display the gauge chart
-            st.plotly_chart(fig)
+        fill_levels = fill_levels[[warehouse for warehouse in fill_levels.columns if warehouse in selected_warehouses]]
+
+    # Display the gauges of all warehouses with a fill level on the selected date in one figure
+    day_levels = fill_levels.loc[pd.Timestamp(selected_date)].dropna()
+    if not day_levels.empty:
+        fig = create_gauge_grid(day_levels.values, day_levels.index, 'fill_level')
+        st.plotly_chart(fig, width='stretch')
+    st.markdown('---')
+
+    # Time series of the fill levels
+    st.plotly_chart(generate_time_series_plot(fill_levels), width='stretch')
+    st.markdown('---')
+
+    # Comparison of several dates, taken from the loaded time series
+    compared_dates = st.multiselect("Compare dates", available_dates, default=[selected_date])
+    if compared_dates:
+        comparison = compare_dates(fill_levels, compared_dates)
+        st.dataframe(comparison)
+        fig = px.bar(comparison, barmode='group', labels={'value': 'Fill Level (%)', 'variable': 'Date'})
+        st.plotly_chart(fig, width='stretch')
+    st.markdown('---')
+
+    # Projection of the date each warehouse becomes full if its fill level keeps its recent trend
+    st.subheader(f"Projected date of reaching {FULL_THRESHOLD}% fill level")
+    trend_days = st.slider("Days of history used for the trend", min_value=2, max_value=90, value=DEFAULT_TREND_DAYS)
+    st.dataframe(project_threshold_crossings(fill_levels, FULL_THRESHOLD, trend_days).round(2), hide_index=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,81 @@
+import streamlit as st
+import plotly.express as px
+from magwiz.db import get_connection
+from magwiz.export import EXPORT_FORMATS, prepare_download
+from magwiz.forecasting import (DEFAULT_DEMAND_WINDOW_DAYS, DEFAULT_HORIZON_DAYS, DEFAULT_SERVICE_LEVEL, SERVICE_LEVELS,
+                                find_projected_shortages, format_forecast_report, get_forecast, load_supplier_lead_times)
+from magwiz.query_cache import get_data_version
+
+# Function to generate the chart of the projected stock-outs per day
+def generate_plot(projected_df):
+    stock_outs = projected_df.groupby('Stock-out Date').size().reset_index(name='Products')
+    fig = px.bar(stock_outs, x='Stock-out Date', y='Products', labels={'Products': 'Number of products'})
+    fig.update_layout(title='Projected stock-outs per day')
+    return fig
+
+# Main function
+def main():
+    st.title('Reorder Forecast')
+
+    # Forecast settings
+    window_days = st.slider("Days of sales used for the demand rate", min_value=7, max_value=90, value=DEFAULT_DEMAND_WINDOW_DAYS)
+    horizon_days = st.slider("Forecast horizon (days)", min_value=1, max_value=90, value=DEFAULT_HORIZON_DAYS)
+    service_level = st.selectbox("Service level", list(SERVICE_LEVELS), index=list(SERVICE_LEVELS).index(DEFAULT_SERVICE_LEVEL))
+
+    # All stocked products are forecast at once, from the daily sales index and the latest stock snapshots
+    with get_connection() as conn:
+        data_version = get_data_version(conn)
+        as_of_date, forecast_df = get_forecast(conn, window_days, service_level)
+        lead_times_df = load_supplier_lead_times(conn)
+    if as_of_date is None:
+        st.write("No stock snapshots.")
+        return
+
+    projected_df = find_projected_shortages(forecast_df, horizon_days)
+    st.write(f"Forecast based on the stock snapshots up to {as_of_date}.")
+
+    # Forecast summary
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric(label="Products to reorder now", value=int(forecast_df['Reorder Now'].sum()))
+    with col2:
+        st.metric(label=f"Projected stock-outs within {horizon_days} days", value=len(projected_df))
+    with col3:
+        st.metric(label="Products already out of stock", value=int((forecast_df['Quantity Available'] == 0).sum()))
+    st.markdown('---')
+
+    # Display the products projected to run out of stock, the most urgent first
+    st.subheader('Projected shortages')
+    report_df = format_forecast_report(projected_df)
+    st.dataframe(report_df, hide_index=True)
+
+    # Button to download data, the file is only generated when it is clicked
+    export_format = st.radio("Download format:", list(EXPORT_FORMATS), horizontal=True)
+    export_key = ('reorder_forecast', window_days, service_level, horizon_days)
+    st.download_button(
+        label=f"Download as {export_format} file",
+        on_click='ignore',
+        **prepare_download(report_df, export_key, export_format, data_version, "reorder_forecast")
+    )
+    st.markdown('---')
+
+    if not projected_df.empty:
+        st.plotly_chart(generate_plot(projected_df))
+        st.markdown('---')
+
+    # Lead time of each supplier, used for the reorder points of its products
+    st.subheader('Supplier lead times (days)')
+    lead_times_df = lead_times_df[['supplier_name', 'deliveries', 'mean_lead_time', 'std_lead_time', 'min_lead_time', 'max_lead_time']]
+    lead_times_df = lead_times_df.rename(columns={
+        'supplier_name': 'Supplier Name',
+        'deliveries': 'Deliveries',
+        'mean_lead_time': 'Mean',
+        'std_lead_time': 'Standard Deviation',
+        'min_lead_time': 'Minimum',
+        'max_lead_time': 'Maximum'
+    })
+    st.dataframe(lead_times_df.round(1), hide_index=True)
+
+# Run the app
+if __name__ == '__main__':
+    main()